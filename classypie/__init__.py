@@ -27,6 +27,9 @@ Python 2 and 3.
 
 Pure Python, no dependencies. 
 
+If NumPy is installed it is used automatically to speed up the processing of
+large numbers of values, see the `backend` option. 
+
 
 ## Installation
 
@@ -101,6 +104,11 @@ license, see license.txt
 __version__ = "0.1.0"
 
 
+import sys
 from .main import *
+from .instrument import Profiler
+from .rawfile import read_chunks, file_breaks, classify_file
+from .grid import grid_breaks, classify_grid
 
-
+if sys.version_info >= (3, 6):
+    from .aio import abreaks, asplit, aclassify
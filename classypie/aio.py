@@ -0,0 +1,218 @@
+"""
+Async counterparts of the main functions, for items that come from async iterators
+such as database cursors or message consumers. Items are read incrementally in chunks,
+and control is given back to the event loop between chunks, while the heavier break
+calculations run in an executor so that the event loop is never blocked.
+
+Requires Python 3.6 or newer.
+"""
+
+from . import main as _main
+from . import stream as _stream
+import asyncio
+import functools
+import itertools
+from array import array
+
+
+
+async def _chunks(items, chunksize):
+    # lists of items from an async or regular iterable
+    if hasattr(items, "__aiter__"):
+        chunk = []
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    else:
+        items = iter(items)
+        while True:
+            chunk = list(itertools.islice(items, chunksize))
+            if not chunk:
+                break
+            yield chunk
+
+async def _run(executor, func, *args, **kwargs):
+    # runs a function in an executor without blocking the event loop
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+def _check_weights(weights):
+    if weights is not None and not callable(weights):
+        raise Exception("Weights must be a function of each item when reading items asynchronously")
+
+async def abreaks(items, algorithm, key=None, extrabreaks=None, exclude=None, minval=None, maxval=None, weights=None, backend=None, stream=False, chunksize=1000, executor=None, **kwargs):
+    """
+    Same as `main.breaks`, but reads the items from an async iterator (or a regular iterable)
+    without blocking the event loop.
+
+    Only the item values are kept, in a compact array. The break points are then calculated
+    in an executor. With stream=True, the values are instead summarized as they arrive,
+    see `main.breaks`, so that memory use stays constant.
+
+    Args:
+
+    - **items**: An async iterator or iterable of items or values.
+    - **algorithm**: Name of the classification algorithm to use.
+    - **key**, **extrabreaks**, **exclude**, **minval**, **maxval**, **backend**, **stream**, and **kwargs** (optional):
+        Same as for `main.breaks`.
+    - **weights** (optional): A function used to extract the weight from each item.
+    - **chunksize** (optional): Number of items to read before giving control back to the event loop.
+    - **executor** (optional): The concurrent.futures executor to calculate the breaks in.
+        Defaults to the default executor of the event loop.
+
+    Returns:
+
+    - List of break points calculated for this algorithm in increasing order.
+    """
+    _check_weights(weights)
+
+    if stream:
+        func = _stream.algorithms.get(algorithm)
+        if func is None:
+            raise Exception("The '%s' algorithm does not support streaming" % algorithm)
+        if weights is not None:
+            raise Exception("Weights are not supported when streaming")
+        if algorithm == "quantile":
+            summary = _stream.QuantileSketch(kwargs.pop("error", 0.01), kwargs.pop("seed", None))
+        else:
+            summary = _stream.Accumulator()
+        # keep the first few values in case there are too few to classify
+        classes = kwargs.get("classes", 5)
+        first = []
+        async for chunk in _chunks(items, chunksize):
+            values = list(_main._stream_values(chunk, key, exclude, minval, maxval))
+            if len(first) <= classes:
+                first.extend(values[:classes + 1 - len(first)])
+            summary.extend(values)
+            await asyncio.sleep(0)
+        breaks = func(first if summary.n <= classes else summary, **kwargs)
+        if extrabreaks:
+            _main._insert_extrabreaks(breaks, extrabreaks)
+        return breaks
+
+    values = array("d")
+    weighted = array("d") if weights is not None else None
+    async for chunk in _chunks(items, chunksize):
+        for item,val,weight in _main._values(chunk, key, exclude, minval, maxval, weights=weights):
+            values.append(val)
+            if weighted is not None:
+                weighted.append(weight)
+        await asyncio.sleep(0)
+    return await _run(executor, _main.breaks, values, algorithm, extrabreaks=extrabreaks,
+                      weights=weighted, backend=backend, **kwargs)
+
+async def asplit(items, breaks, key=None, exclude=None, minval=None, maxval=None, weights=None, backend=None, chunksize=1000, executor=None, **kwargs):
+    """
+    Same as `main.split`, but reads the items from an async iterator (or a regular iterable)
+    without blocking the event loop. The groupings are calculated in an executor once all
+    items have been read.
+
+    Args:
+
+    - **items**: An async iterator or iterable of items or values.
+    - **breaks**: List of custom break values, or the name of the algorithm to use.
+    - **key**, **exclude**, **minval**, **maxval**, **backend**, and **kwargs** (optional): Same as for `main.split`.
+    - **weights** (optional): A function used to extract the weight from each item.
+    - **chunksize**, **executor** (optional): See `abreaks`.
+
+    Returns:
+
+    - Asynchronously iterates over the range groupings, each time yielding a 2-tuple of the group
+        (its min-max value range) and a list of the items belonging to that group.
+    """
+    _check_weights(weights)
+    collected = []
+    async for chunk in _chunks(items, chunksize):
+        collected.extend(chunk)
+        await asyncio.sleep(0)
+    groups = await _run(executor, lambda: list(_main.split(collected, breaks, key=key, exclude=exclude, minval=minval, maxval=maxval,
+                                                            weights=weights, backend=backend, **kwargs)))
+    for valrange,members in groups:
+        yield valrange, members
+
+async def aclassify(items, breaks, classvalues=None, key=None, exclude=None, minval=None, maxval=None, chunksize=1000):
+    """
+    Assigns classes to items from an async iterator (or a regular iterable) as they arrive,
+    given break points that are already known, e.g. from `abreaks` or an existing `main.Classifier`.
+    Items outside the breaks or that are filtered out are skipped, like when iterating a Classifier.
+
+    Args:
+
+    - **items**: An async iterator or iterable of items or values.
+    - **breaks**: List of break values, a `main.BreakIndex`, or a `main.Classifier` whose
+        breaks and class values are used.
+    - **classvalues** (optional): A gradient of class values to assign to each class, see `main.Classifier`.
+        If not given, yields the class number of each item instead (1 as the first class).
+    - **key**, **exclude**, **minval**, **maxval** (optional): Same as for `main.split`.
+    - **chunksize** (optional): Number of items to classify before giving control back to the event loop.
+
+    Returns:
+
+    - Asynchronously iterates over the items, each time yielding a 2-tuple of the item along with its
+        class value or class number.
+    """
+    if isinstance(breaks, _main.Classifier):
+        classifier = breaks
+        if classifier.algo == "unique":
+            raise Exception("Classifying items as they arrive is not supported for unique classifications")
+        if key is None:
+            key = classifier.key
+        if exclude is None:
+            exclude = classifier.kwargs.get("exclude")
+        if minval is None:
+            minval = classifier.kwargs.get("minval")
+        if maxval is None:
+            maxval = classifier.kwargs.get("maxval")
+        classifier.update(force=False)
+        index = classifier._index
+        if classifier.algo == "proportional":
+            lookup = None
+            newval = _main._rescaler(classifier.breaks[0], classifier.breaks[-1],
+                                     classifier.classvalues_interp[0], classifier.classvalues_interp[-1])
+        else:
+            lookup = classifier.classvalues_interp
+            newval = None
+    else:
+        index = breaks if isinstance(breaks, _main.BreakIndex) else _main.BreakIndex(list(breaks))
+        lookup = _main.class_values(len(index), classvalues) if classvalues is not None else None
+        newval = None
+
+    classify = index.classify
+    async for chunk in _chunks(items, chunksize):
+        for item,val,weight in _main._values(chunk, key, exclude, minval, maxval):
+            if newval is not None:
+                yield item, newval(val)
+                continue
+            classnum = classify(val)
+            if classnum is not None:
+                yield item, lookup[classnum-1] if lookup is not None else classnum
+        await asyncio.sleep(0)
+
+async def aiterate(classifier, chunksize=1000, executor=None):
+    """
+    Asynchronously iterates over a `main.Classifier`, the same way as iterating it directly.
+    The breaks are updated in an executor, and control is given back to the event loop
+    after every chunk of items. Used by `async for` over a Classifier.
+
+    Args:
+
+    - **classifier**: The Classifier to iterate over.
+    - **chunksize**, **executor** (optional): See `abreaks`.
+
+    Returns:
+
+    - Asynchronously iterates over the items, each time yielding a tuple of the item along with its class value.
+    """
+    if classifier.algo != "unique":
+        await _run(executor, classifier.update, force=False)
+    results = iter(classifier)
+    while True:
+        chunk = await _run(executor, lambda: list(itertools.islice(results, chunksize)))
+        if not chunk:
+            break
+        for result in chunk:
+            yield result
@@ -7,8 +7,46 @@ directly, but rather use the higher-level functionality in main.py.
 # modified: Karim Bahgat, 2015
 
 from __future__ import division
+from . import instrument as _instrument
 import math
 import random
+import bisect
+import itertools
+from array import array
+
+
+
+# Weight helpers
+
+def _weighted_knots(values, weights):
+    # the quantile function of weighted values as positions from 0 to 1 along the normalized
+    # cumulative weights and the value at each position, to interpolate linearly between.
+    # each value stays flat while its weight exceeds one unit and then moves on to the next value,
+    # the same as repeating each value as many times as its weight
+    total = float(sum(weights))
+    step = 1 / total
+    positions = array('d')
+    posvalues = array('d')
+    cum = 0.0
+    for val,w in zip(values, weights):
+        start = cum / total
+        cum += w
+        end = cum / total - step
+        positions.append(start)
+        posvalues.append(val)
+        if end > start:
+            positions.append(end)
+            posvalues.append(val)
+    return positions, posvalues
+
+def _cumulative(weights):
+    # running total of weights
+    cumweights = array('d')
+    total = 0.0
+    for w in weights:
+        total += w
+        cumweights.append(total)
+    return cumweights
 
 
 
@@ -20,18 +58,19 @@ def histogram(values, **kwargs):
     """
     return equal(values, **kwargs)
 
-def equal(values, classes=5, interval=None, anchor=None, clip=True, start=None, end=None):
+def equal(values, classes=5, interval=None, anchor=None, clip=True, start=None, end=None, weights=None):
     """
     Equal interval algorithm in Python
     
     Returns breaks based on dividing the range of 'values' into 'classes' parts,
-    or by specifying the interval and/or anchorpoint to start the divisioning. 
+    or by specifying the interval and/or anchorpoint to start the divisioning.
+    Weights are accepted but have no effect since only the value range matters. 
     """
     #values = sorted(values) # maybe not needed as is already done main.py
 
     if len(values) == 1:
         # when too few values, just return breakpoints for each unique value, ignoring classes
-        return values * 2
+        return list(values) * 2
     
     # auto detect value range from values if not custom specified
     if start == None:
@@ -76,16 +115,17 @@ def equal(values, classes=5, interval=None, anchor=None, clip=True, start=None,
 
     return res
 
-def log(values, classes=5):
+def log(values, classes=5, weights=None):
     """
     Log classification algorithm.
 
     Returns break points at equal intervals of the log10 of input values.
     Handles 0s by adding 1 before log transforming. Negative values will raise Exception.
+    Weights are accepted but have no effect since only the value range matters. 
     """
     # if too few values, just return breakpoints for each unique value, ignoring classes
     if len(values) == 1:
-        return values * 2
+        return list(values) * 2
     
     # log transform values
     logs = [math.log10(v+1) for v in values]
@@ -104,12 +144,15 @@ def log(values, classes=5):
     
     return breaks
     
-def quantile(values, classes=5):
+def quantile(values, classes=5, weights=None):
     """
     Quantile algorithm in Python
     
     Returns values taken at regular intervals from the cumulative 
     distribution function (CDF) of 'values'.
+
+    If weights are given, each value counts as many times as its weight,
+    so that integer weights give the same breaks as repeating each value. 
     """
 
     #values = sorted(values) # maybe not needed as is already done main.py
@@ -120,6 +163,22 @@ def quantile(values, classes=5):
     
     n = len(values)
     breaks = []
+    if weights is not None:
+        # interpolate on the normalized cumulative weights instead of the value indexes
+        positions, posvalues = _weighted_knots(values, weights)
+        last = len(positions) - 1
+        for i in range(classes):
+            q = i / float(classes)
+            j = bisect.bisect_right(positions, q) - 1
+            if j >= last:
+                Xq = posvalues[last]
+            else:
+                r = (q - positions[j]) / (positions[j+1] - positions[j])
+                Xq = (1 - r) * posvalues[j] + r * posvalues[j+1]
+            breaks.append(Xq)
+        breaks.append(values[n-1])
+        return breaks
+        
     for i in range(classes):
         q = i / float(classes)
         a = q * n
@@ -130,7 +189,7 @@ def quantile(values, classes=5):
     breaks.append(values[n-1])
     return breaks
 
-def pretty(values, classes=5, start=None, end=None):
+def pretty(values, classes=5, start=None, end=None, weights=None):
     """
     R's pretty algorithm implemented in Python
     Code based on R implementation from 'labeling' R package.
@@ -140,7 +199,8 @@ def pretty(values, classes=5, start=None, end=None):
     so that they are 1, 2 or 5 times a power of 10.
 
     Returns a number of breaks not necessarily equal to 'classes' using 
-    rpretty, but likely to be legible.
+    rpretty, but likely to be legible. Weights are accepted but have no
+    effect since only the value range matters. 
 
     Parameters:
         values : list of input values
@@ -149,7 +209,7 @@ def pretty(values, classes=5, start=None, end=None):
 
     # if too few values, just return breakpoints for each unique value, ignoring classes
     if values and len(values) == 1:
-        return values * 2
+        return list(values) * 2
 
     # auto detect value range from values if not custom specified
     if start == None:
@@ -242,33 +302,135 @@ def pretty(values, classes=5, start=None, end=None):
         res[-1] = dmax
     return res
 
-def stdev(values, classes=5):
+def stdev(values, classes=5, weights=None):
     """
     Python implementation of the standard deviation class interval algorithm
     as implemented in the 'classInt' package available for 'R'.
     
     Returns breaks based on 'pretty' of the centred and scaled values of 'values',
     and may have a number of classes different from 'classes'.
+    If weights are given, uses the weighted mean and standard deviation. 
     """
 
     # if too few values, just return breakpoints for each unique value, ignoring classes
     if len(values) <= classes:
-        return list(values) + [values[-1]]
+        values = sorted(values)
+        return values + [values[-1]]
 
     sd2 = 0.0
-    N = len(values)
     _min = min(values)
     _max = max(values)
-    mean = sum(values) / N
-    for i in values:
-        sd = i - mean
-        sd2 += sd * sd
+    if weights is not None:
+        N = sum(weights)
+        mean = sum(i * w for i,w in zip(values, weights)) / N
+        for i,w in zip(values, weights):
+            sd = i - mean
+            sd2 += w * sd * sd
+    else:
+        N = len(values)
+        mean = sum(values) / N
+        for i in values:
+            sd = i - mean
+            sd2 += sd * sd
     sd2 = math.sqrt(sd2 / N)
     res = pretty(values=None, classes=5, start=(_min-mean)/sd2, end=(_max-mean)/sd2)
     res2 = [(val*sd2)+mean for val in res]
     return res2
 
-def natural(values, classes=5, maxsize=1000, samples=3):
+def _jenks(values, classes, weights=None):
+    # exact optimal breaks for sorted values
+    starts = _jenks_table(values, classes, weights)
+    return _jenks_backtrack(values, starts, classes)
+
+def _jenks_many(values, classes, weights=None):
+    # exact optimal breaks for several numbers of classes, since the
+    # table for the largest number of classes also holds all the smaller ones
+    starts = _jenks_table(values, max(classes), weights)
+    return dict((k, _jenks_backtrack(values, starts, k)) for k in classes)
+
+def _jenks_table(values, classes, weights=None):
+    # the optimal start of the last class for each end value and number of classes
+    n = len(values)
+
+    # prefix sums, shifted by the median for numerical stability
+    shift = float(values[n // 2])
+    if weights is None:
+        counts = array('d', range(n+1))
+        weights = itertools.repeat(1.0)
+    else:
+        counts = array('d', [0.0])
+        counts.extend(_cumulative(weights))
+    sums = array('d', [0.0])
+    sqsums = array('d', [0.0])
+    s1 = s2 = 0.0
+    for val,w in zip(values, weights):
+        val = float(val) - shift
+        s1 += w * val
+        s2 += w * val * val
+        sums.append(s1)
+        sqsums.append(s2)
+
+    # within class sum of squares when all values up to
+    # and including value m are in a single class
+    cost = array('d', [0.0]) * n
+    for m in range(n):
+        s1 = sums[m+1]
+        cost[m] = sqsums[m+1] - s1 * s1 / counts[m+1]
+
+    # for each additional class, find the optimal start of the last class for
+    # each end value m, using that the optimal start never decreases with m
+    starts = [None, None]
+    inf = float('inf')
+    cells = 0
+    for k in range(2, classes+1):
+        prevcost = cost
+        cost = array('d', [inf]) * n
+        start = array('l', [0]) * n
+        stack = [(k-1, n-1, k-1, n-1)]
+        while stack:
+            lo, hi, optlo, opthi = stack.pop()
+            m = (lo + hi) // 2
+            best = inf
+            bestj = optlo
+            endsum = sums[m+1]
+            endsqsum = sqsums[m+1]
+            endcount = counts[m+1]
+            cells += min(opthi, m) + 1 - optlo
+            for j in range(optlo, min(opthi, m) + 1):
+                s1 = endsum - sums[j]
+                c = prevcost[j-1] + (endsqsum - sqsums[j] - s1 * s1 / (endcount - counts[j]))
+                if c < best:
+                    best = c
+                    bestj = j
+            cost[m] = best
+            start[m] = bestj
+            if lo < m:
+                stack.append((lo, m-1, optlo, bestj))
+            if m < hi:
+                stack.append((m+1, hi, bestj, opthi))
+        starts.append(start)
+    prof = _instrument.current()
+    if prof: prof.count("dp_cells", cells)
+    return starts
+
+def _jenks_backtrack(values, starts, classes):
+    # backtrack the class starts, each break is the last value of the previous class
+    n = len(values)
+    kclass = [0] * (classes+1)
+    kclass[0] = float(values[0])
+    kclass[classes] = float(values[n-1])
+    m = n - 1
+    for k in range(classes, 1, -1):
+        j = starts[k][m]
+        kclass[k-1] = values[j-1]
+        m = j - 1
+    return kclass
+
+def _jenks_sample(args):
+    # calculates the breaks of one subsample, used by natural in worker processes
+    return _jenks(*args)
+
+def natural(values, classes=5, maxsize=None, samples=3, weights=None, workers=None, seed=None):
     """
     Jenks Optimal (Natural Breaks) algorithm implemented in Python.
     The original Python code comes from here:
@@ -279,10 +441,20 @@ def natural(values, classes=5, maxsize=1000, samples=3):
     Returns class breaks such that classes are internally homogeneous while 
     assuring heterogeneity among classes.
 
-    For very large datasets (larger than maxsize), will calculate only on
-    subsample to avoid exponential runtimes. Calculated multiple times (samples)
+    The optimal breaks are found exactly with the dynamic programming approach
+    of Ckmeans.1d.dp, using divide-and-conquer and prefix sums so that it runs
+    in O(k*n*log(n)) time instead of O(k*n^2), and stores only one compact array
+    of class starts per class. If weights are given, minimizes the weighted
+    sum of squares, so that integer weights give the same breaks as repeating
+    each value. 
+
+    Optionally, for very large datasets (larger than maxsize), will calculate only on
+    subsample to reduce runtimes. Calculated multiple times (samples)
     and takes the average break values for better consistency. Lower and higher
-    bounds are kept intact. 
+    bounds are kept intact. The samples can be calculated in parallel by a pool of
+    worker processes, and a seed makes the subsamples and thus the breaks
+    reproducible. Since the subsamples are always drawn in advance the results
+    are the same regardless of the number of workers. 
     """
 
     #values = sorted(values) # maybe not needed as is already done main.py
@@ -291,111 +463,88 @@ def natural(values, classes=5, maxsize=1000, samples=3):
     if len(values) <= classes:
         return list(values) + [values[-1]]
 
-    def getbreaks(values, classes):
-        # the original algorithm by Carson Farmer
-        mat1 = []
-        for i in range(0,len(values)+1):
-            temp = []
-            for j in range(0,classes+1):
-                temp.append(0)
-            mat1.append(temp)
-        mat2 = []
-        for i in range(0,len(values)+1):
-            temp = []
-            for j in range(0,classes+1):
-                temp.append(0)
-            mat2.append(temp)
-        for i in range(1,classes+1):
-            mat1[1][i] = 1
-            mat2[1][i] = 0
-            for j in range(2,len(values)+1):
-                mat2[j][i] = float('inf')
-        v = 0.0
-        for l in range(2,len(values)+1):
-            s1 = 0.0
-            s2 = 0.0
-            w = 0.0
-            for m in range(1,l+1):
-                i3 = l - m + 1
-                val = float(values[i3-1])
-                s2 += val * val
-                s1 += val
-                w += 1
-                v = s2 - (s1 * s1) / w
-                i4 = i3 - 1
-                if i4 != 0:
-                    for j in range(2,classes+1):
-                        if mat2[l][j] >= (v + mat2[i4][j - 1]):
-                            mat1[l][j] = i3
-                            mat2[l][j] = v + mat2[i4][j - 1]
-            mat1[l][1] = 1
-            mat2[l][1] = v
-        k = len(values)
-        kclass = []
-        for i in range(0,classes+1):
-            kclass.append(0)
-        kclass[classes] = float(values[len(values) - 1])
-        kclass[0] = float(values[0])
-        countNum = classes
-        while countNum >= 2:
-            id = int((mat1[k][countNum]) - 2)
-            kclass[countNum - 1] = values[id]
-            k = int((mat1[k][countNum] - 1))
-            countNum -= 1
-        return kclass
-
-    # Automatic sub sampling for large datasets
+    # Optional sub sampling for large datasets
     # The idea of using random sampling for large datasets was in the original code. 
     # However, since these samples tend to produce different results,
     # ...to produce more stable results we might as well calculate the
     # ...breaks several times and using the sample means for the final break values.
     
-    if len(values) > maxsize:
-        allrandomsamples = []
+    if maxsize and len(values) > maxsize:
+        rand = random.Random(seed) if seed is not None else random
+        jobs = []
         for _ in range(samples):
-            randomsample = sorted(random.sample(values, maxsize))
+            indexes = sorted(rand.sample(range(len(values)), maxsize))
             
             # include lower and higher bounds to ensure the whole range is considered
-            randomsample[0] = values[0] 
-            randomsample[-1] = values[-1]
+            indexes[0] = 0
+            indexes[-1] = len(values) - 1
+            randomsample = [values[i] for i in indexes]
+            sampleweights = [weights[i] for i in indexes] if weights is not None else None
+            jobs.append((randomsample, classes, sampleweights))
             
-            # get sample break
-            tempbreaks = getbreaks(randomsample, classes)
-            allrandomsamples.append(tempbreaks)
+        # get sample breaks
+        if workers and workers > 1 and len(jobs) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(min(workers, len(jobs)))
+            try:
+                allrandomsamples = pool.map(_jenks_sample, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            allrandomsamples = [_jenks_sample(job) for job in jobs]
             
         # get average of all sampled break values
         jenksbreaks = [sum(allbreakvalues)/float(len(allbreakvalues))
                        for allbreakvalues in zip(*allrandomsamples)]
         
     else:
-        jenksbreaks = getbreaks(values, classes)
+        jenksbreaks = _jenks(values, classes, weights)
 
     return jenksbreaks
 
-def headtail(values, classes=5):
+def headtail(values, classes=5, weights=None):
     """
     New head tails classification scheme,
     claimed to better highlight a few very
     large values than natural breaks.
     See: http://arxiv.org/ftp/arxiv/papers/1209/1209.2801.pdf
+
+    If weights are given, uses weighted means and compares
+    the total weights of the head and tail. 
     """
 
     # if too few values, just return breakpoints for each unique value, ignoring classes
     if len(values) == 1:
-        return values * 2
+        return list(values) * 2
 
-    def _mean(values):
-        return sum(values)/float(len(values))
-    
-    def _mbreak(values):
-        m = _mean(values)
-        head = [v for v in values if v >= m]
-        tail = [v for v in values if v < m]
-        return head,m,tail
+    if weights is not None:
+        def _mbreak(pairs):
+            m = sum(v*w for v,w in pairs) / float(sum(w for v,w in pairs))
+            head = [(v,w) for v,w in pairs if v >= m]
+            tail = [(v,w) for v,w in pairs if v < m]
+            return head,m,tail
+
+        def _size(pairs):
+            return sum(w for v,w in pairs)
+
+        values = list(zip(values, weights))
+
+    else:
+        def _mean(values):
+            return sum(values)/float(len(values))
+        
+        def _mbreak(values):
+            m = _mean(values)
+            head = [v for v in values if v >= m]
+            tail = [v for v in values if v < m]
+            return head,m,tail
+
+        _size = len
 
     breaks = []
     head,m,tail = _mbreak(values)
-    while len(tail) > len(head):
+    while _size(tail) > _size(head):
         breaks.append(m)
         if len(head) > 1:
             head,m,tail = _mbreak(head)
@@ -403,6 +552,8 @@ def headtail(values, classes=5):
             break
 
     # add first and last endpoints
+    if weights is not None:
+        values = [v for v,w in values]
     breaks.insert(0, values[0])
     breaks.append(values[-1])
     
@@ -0,0 +1,386 @@
+"""
+Caching of calculated break points, so that the breaks of the same values with the same
+algorithm and options are only calculated once. The cache key is a fast fingerprint of the
+extracted values, along with the algorithm name and options. The values are sorted, except
+for the algorithms that only need the value range or mean and standard deviation.
+
+There are two caches, both disabled by default:
+
+- An in-memory cache of the most recently used breaks and class values, e.g. for calculating
+    the same breaks for a legend, map and histogram, see `set_memory_cache`.
+- A persistent cache that is shared across processes, see `set_disk_cache`:
+
+    >>> import classypie as cp
+    >>> cp.cache.set_disk_cache("breaks.sqlite")
+    >>> cp.breaks(values, "natural") # calculated and stored
+    >>> cp.breaks(values, "natural") # looked up, also after a restart
+
+The caches are consulted whenever breaks are calculated from a set of extracted and sorted values,
+e.g. by `main.breaks`, `main.split` and `main.Classifier`. They are not consulted when streaming,
+which includes `main.breaks` with the equal, histogram, log, pretty and stdev algorithms and the
+pure Python backend, since these read the values once without keeping them, which is cheaper than
+fingerprinting them. Natural breaks of random samples without a seed are never cached.
+"""
+
+from . import instrument as _instrument
+import hashlib
+import json
+import sqlite3
+import time
+import threading
+from collections import OrderedDict
+from array import array
+
+# increase if the algorithms change in a way that invalidates stored breaks
+_version = 1
+
+# options that do not change the breaks, left out of the cache keys
+_ignored = ("workers",)
+
+_disk = None
+_memory = None
+
+
+
+# Keys
+
+def fingerprint(values, weights=None):
+    """
+    Returns a hex digest of a sequence of numbers and their optional weights.
+    Float arrays are hashed directly from their memory, without copying.
+
+    Args:
+
+    - **values**: An array.array, NumPy array, or sequence of numbers.
+    - **weights** (optional): A sequence of weights of the values.
+    """
+    digest = hashlib.sha1()
+    _update(digest, values)
+    if weights is not None:
+        digest.update(b"weights")
+        _update(digest, weights)
+    return digest.hexdigest()
+
+def _update(digest, values):
+    # hash the memory of the values as 64-bit floats, without copying if possible
+    if hasattr(values, "dtype"):
+        # numpy array, only copied if not contiguous
+        import numpy
+        values = numpy.ascontiguousarray(values)
+        if values.dtype != numpy.float64:
+            digest.update(values.dtype.str.encode("utf8"))
+        digest.update(values)
+        return
+    if not (isinstance(values, array) and values.typecode == "d"):
+        values = array("d", values)
+    try:
+        digest.update(values)
+    except TypeError:
+        # older pythons without the buffer protocol in hashlib
+        digest.update(values.tostring())
+
+def cache_key(algorithm, values, weights=None, numpy=False, **kwargs):
+    """
+    Returns the cache key of the breaks of the given values, algorithm and options.
+    The pure Python and NumPy algorithms have separate keys, since their results can
+    differ by rounding errors.
+    """
+    options = repr(sorted((name, val) for name,val in kwargs.items() if name not in _ignored))
+    return "%s:%s:%s:%s:%s" % (_version, algorithm, "numpy" if numpy else "python",
+                               fingerprint(values, weights), hashlib.sha1(options.encode("utf8")).hexdigest())
+
+
+
+# In-memory cache
+
+class MemoryCache(object):
+    """
+    A thread-safe store of the most recently used results in memory. When the store is full,
+    the least recently used results are removed.
+
+    Attributes:
+
+    - maxsize: Maximum number of results to store.
+    - hits: Number of lookups that found a stored result.
+    - misses: Number of lookups that did not.
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        Args:
+
+        - **maxsize** (optional): Maximum number of results to store. Defaults to 128.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "MemoryCache(maxsize=%r, size=%r, hits=%r, misses=%r)" % (self.maxsize, len(self), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """
+        Returns the stored result of a key, or None if not stored.
+        """
+        with self._lock:
+            result = self._results.pop(key, None)
+            if result is None:
+                self.misses += 1
+                return None
+            # most recently used last
+            self._results[key] = result
+            self.hits += 1
+            return result
+
+    def set(self, key, result):
+        """
+        Stores the result of a key, and removes the least recently used results if the store is full.
+        """
+        with self._lock:
+            self._results.pop(key, None)
+            self._results[key] = result
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Removes the stored result of a key, if any.
+        """
+        with self._lock:
+            self._results.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all stored results and resets the statistics.
+        """
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Returns a dictionary of the hits, misses, size and maxsize of the cache.
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._results), maxsize=self.maxsize)
+
+def set_memory_cache(maxsize=128):
+    """
+    Enables, resizes or disables the in-memory cache of break points and class values.
+    The previously stored results are removed.
+
+    Args:
+
+    - **maxsize** (optional): Maximum number of results to store, or None or 0 to disable the cache.
+        Defaults to 128.
+
+    Returns:
+
+    - The `MemoryCache`, or None if disabled.
+    """
+    global _memory
+    _memory = MemoryCache(maxsize) if maxsize else None
+    return _memory
+
+def get_memory_cache():
+    """
+    Returns the `MemoryCache` in use, or None if the in-memory cache is disabled.
+    """
+    return _memory
+
+def cache_info():
+    """
+    Returns a dictionary of the hits, misses, size and maxsize of the in-memory cache,
+    or None if it is disabled.
+    """
+    memory = _memory
+    return memory.info() if memory is not None else None
+
+def clear(disk=False):
+    """
+    Removes all results from the in-memory cache, and from the persistent cache if disk is True.
+    """
+    memory = _memory
+    if memory is not None:
+        memory.clear()
+    if disk and _disk is not None:
+        _disk.clear()
+
+
+
+# Persistent cache
+
+class DiskCache(object):
+    """
+    A persistent store of break points in a local SQLite database file, which can be shared
+    between processes. When the store is full, the least recently used breaks are removed.
+
+    Attributes:
+
+    - path: Path to the database file.
+    - maxsize: Maximum number of breaks to store.
+    """
+
+    def __init__(self, path, maxsize=1000):
+        """
+        Args:
+
+        - **path**: Path to the database file, which is created if it does not exist.
+        - **maxsize** (optional): Maximum number of breaks to store. Defaults to 1000.
+        """
+        self.path = path
+        self.maxsize = maxsize
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS breaks (key TEXT PRIMARY KEY, breaks TEXT, used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS breaks_used ON breaks (used)")
+
+    def __repr__(self):
+        return "DiskCache(%r, maxsize=%r)" % (self.path, self.maxsize)
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM breaks").fetchone()[0]
+
+    def _connect(self):
+        # a new connection for each operation, so that the cache can be used from any thread
+        return _Connection(sqlite3.connect(self.path, timeout=30))
+
+    def get(self, key):
+        """
+        Returns the stored breaks of a key, or None if not stored.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT breaks FROM breaks WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE breaks SET used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key, breaks):
+        """
+        Stores the breaks of a key, and removes the least recently used breaks if the store is full.
+        """
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO breaks VALUES (?, ?, ?)",
+                         (key, json.dumps([float(brk) for brk in breaks]), time.time()))
+            count = conn.execute("SELECT COUNT(*) FROM breaks").fetchone()[0]
+            if count > self.maxsize:
+                conn.execute("DELETE FROM breaks WHERE key IN (SELECT key FROM breaks ORDER BY used LIMIT ?)",
+                             (count - self.maxsize,))
+
+    def clear(self):
+        """
+        Removes all stored breaks.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM breaks")
+
+class _Connection(object):
+    # commits and closes a sqlite connection when used as a context manager
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
+
+def set_disk_cache(path, maxsize=1000):
+    """
+    Enables or disables the persistent cache of break points.
+
+    Args:
+
+    - **path**: Path to the database file to store the breaks in, or None to disable the cache.
+    - **maxsize** (optional): Maximum number of breaks to store. Defaults to 1000.
+
+    Returns:
+
+    - The `DiskCache`, or None if disabled.
+    """
+    global _disk
+    _disk = DiskCache(path, maxsize) if path is not None else None
+    return _disk
+
+def get_disk_cache():
+    """
+    Returns the `DiskCache` in use, or None if the persistent cache is disabled.
+    """
+    return _disk
+
+
+
+# Lookup
+
+def enabled():
+    """
+    Whether any cache of break points is enabled.
+    """
+    return _memory is not None or _disk is not None
+
+def _random(name, kwargs):
+    # natural breaks of random samples differ each time unless seeded
+    return name == "natural" and kwargs.get("maxsize") and kwargs.get("seed") is None
+
+def cached(func, name, values, weights=None, numpy=False, **kwargs):
+    """
+    Returns the breaks of the values from the cache, or calculates them with
+    func(name, values, weights, numpy, **kwargs) and stores them. Mostly used internally.
+    """
+    memory, disk = _memory, _disk
+    if (memory is None and disk is None) or _random(name, kwargs):
+        return func(name, values, weights, numpy, **kwargs)
+    prof = _instrument.current()
+    key = cache_key(name, values, weights, numpy, **kwargs)
+    if memory is not None:
+        breaks = memory.get(key)
+        if breaks is not None:
+            if prof: prof.count("cache_hits")
+            return list(breaks)
+    if disk is not None:
+        breaks = disk.get(key)
+        if breaks is not None:
+            if prof: prof.count("cache_hits")
+            if memory is not None:
+                memory.set(key, tuple(breaks))
+            return breaks
+    if prof: prof.count("cache_misses")
+    breaks = func(name, values, weights, numpy, **kwargs)
+    if memory is not None:
+        memory.set(key, tuple(breaks))
+    if disk is not None:
+        disk.set(key, breaks)
+    return breaks
+
+def cached_class_values(func, classes, valuestops):
+    """
+    Returns the class values from the in-memory cache, or calculates them with
+    func(classes, valuestops) and stores them. Mostly used internally.
+    """
+    memory = _memory
+    if memory is None:
+        return func(classes, valuestops)
+    try:
+        key = "class_values:%r:%r" % (classes, [tuple(stop) if hasattr(stop, "__iter__") else stop for stop in valuestops])
+    except TypeError:
+        return func(classes, valuestops)
+    classvalues = memory.get(key)
+    if classvalues is None:
+        classvalues = func(classes, valuestops)
+        memory.set(key, [list(val) if isinstance(val, list) else val for val in classvalues])
+    # copies, so that changes to the returned class values do not change the cache
+    return [list(val) if isinstance(val, list) else val for val in classvalues]
@@ -0,0 +1,178 @@
+"""
+Classification of gridded data such as rasters, which may be split into several tiles.
+Each tile is either a 2D NumPy array, or a row-major sequence of the grid cell values
+such as an array.array or memoryview. Breaks are calculated over all the tiles
+at once, and each tile is then classified into a grid of the same size.
+"""
+
+from __future__ import division
+from . import main as _main
+from . import vectorized as _vectorized
+from array import array
+
+
+
+def _tilevalues(tile, usenumpy):
+    # all the cell values of a tile, as a flat float NumPy array or array.array
+    if usenumpy:
+        return _vectorized.numpy.asarray(tile, dtype=float).ravel()
+    if hasattr(tile, "ravel"):
+        # numpy array
+        return array("d", tile.astype(float).ravel().tobytes())
+    if isinstance(tile, memoryview) and tile.ndim > 1:
+        tile = tile.cast("B").cast(tile.format)
+    if _main._buffer_format(tile) is not None:
+        return _main._buffer_values(tile)
+    return array("d", tile)
+
+def _picklable(tile, usenumpy):
+    # a copy of memoryview tiles that can be sent to other processes
+    if isinstance(tile, memoryview):
+        if usenumpy:
+            return _vectorized.numpy.array(tile)
+        return _tilevalues(tile, False)
+    return tile
+
+def _valid(values, nodata, usenumpy):
+    # the values that are not nodata or NaN
+    if usenumpy:
+        mask = ~_vectorized.numpy.isnan(values)
+        if nodata is not None:
+            mask &= values != nodata
+        return values[mask]
+    if nodata is not None:
+        return array("d", [val for val in values if val == val and val != nodata])
+    return array("d", [val for val in values if val == val])
+
+def grid_breaks(tiles, algorithm, nodata=None, backend=None, extrabreaks=None, **kwargs):
+    """
+    Calculates the break points of all the cell values of one or more grid tiles.
+
+    Args:
+
+    - **tiles**: A list of grid tiles, each a 2D NumPy array or a row-major sequence of cell values.
+    - **algorithm**: Name of the classification algorithm to use, see `main.breaks`.
+    - **nodata** (optional): Value of grid cells that are missing data, which are left out along with NaN values.
+    - **backend** (optional): Whether to process the values as NumPy arrays ('numpy') or in pure Python ('python').
+        Defaults to 'auto' which uses NumPy whenever it is installed. With NumPy, nodata cells are masked
+        out without checking each value in Python.
+    - **extrabreaks** (optional): Force insert additional break points, see `main.breaks`.
+    - **kwargs** (optional): Any remaining kwargs are passed to the algorithm function.
+
+    Returns:
+
+    - List of break points calculated for this algorithm in increasing order.
+    """
+    usenumpy = _main._use_numpy(backend)
+    if usenumpy:
+        numpy = _vectorized.numpy
+        values = [_valid(_tilevalues(tile, True), nodata, True) for tile in tiles]
+        values = numpy.concatenate(values) if values else numpy.zeros(0)
+        if algorithm not in _main._single_pass:
+            values.sort()
+    else:
+        values = array("d")
+        for tile in tiles:
+            values.extend(_valid(_tilevalues(tile, False), nodata, False))
+        if algorithm not in _main._single_pass:
+            values = array("d", sorted(values))
+    breaks = _main._algorithm(algorithm, values, numpy=usenumpy, **kwargs)
+    if extrabreaks:
+        _main._insert_extrabreaks(breaks, extrabreaks)
+    return breaks
+
+def _classify_tile(args):
+    # class numbers or class values of a single tile, used by classify_grid in worker processes
+    tile, breaks, nodata, typecode, lookup, usenumpy = args
+    index = _main.BreakIndex(breaks)
+    values = _tilevalues(tile, usenumpy)
+
+    if usenumpy:
+        numpy = _vectorized.numpy
+        if index.ordered:
+            classnums = _vectorized.classify(values, index.breaks)
+        else:
+            classnums = numpy.array([classnum or 0 for classnum in index.classify_many(values.tolist())], dtype=int)
+        invalid = numpy.isnan(values)
+        if nodata is not None:
+            invalid |= values == nodata
+        classnums[invalid] = 0
+        shape = numpy.shape(tile)
+        if lookup is not None:
+            lookup = numpy.asarray(lookup, dtype=float)
+            return lookup[classnums].reshape(shape + lookup.shape[1:])
+        return classnums.astype(numpy.dtype(typecode)).reshape(shape)
+
+    classify = index.classify
+    if nodata is not None:
+        classnums = array(typecode, [(classify(val) or 0) if val == val and val != nodata else 0 for val in values])
+    else:
+        classnums = array(typecode, [(classify(val) or 0) if val == val else 0 for val in values])
+    if lookup is not None:
+        if hasattr(lookup[0], "__iter__"):
+            # class value sequences are interleaved
+            return array("d", [band for classnum in classnums for band in lookup[classnum]])
+        return array("d", [lookup[classnum] for classnum in classnums])
+    return classnums
+
+def classify_grid(tiles, breaks, nodata=None, classvalues=None, nodatavalue=None, typecode=None, workers=None, backend=None, **kwargs):
+    """
+    Classifies the cells of one or more grid tiles, with the breaks calculated over all the tiles.
+
+    Args:
+
+    - **tiles**: A list of grid tiles, each a 2D NumPy array or a row-major sequence of cell values.
+    - **breaks**: List of custom break values, or the name of the algorithm to use.
+    - **nodata** (optional): Value of grid cells that are missing data, which are left out along with NaN values.
+    - **classvalues** (optional): If given, returns the class value of each cell instead of its class number,
+        see `main.class_values`. Sequences of class values such as rgb colors are returned as a third dimension
+        of NumPy tiles, and interleaved for other tiles.
+    - **nodatavalue** (optional): The class value of nodata cells and cells outside the breaks. Defaults to 0, or
+        a sequence of 0s for sequences of class values.
+    - **typecode** (optional): The array.array typecode of the class numbers. Defaults to the smallest
+        unsigned integer type that fits the number of classes.
+    - **workers** (optional): Number of processes to classify the tiles in parallel.
+    - **backend** (optional): Whether to process the values as NumPy arrays ('numpy') or in pure Python ('python').
+        Defaults to 'auto' which uses NumPy whenever it is installed.
+    - **kwargs** (optional): Any remaining kwargs are passed to `grid_breaks`.
+
+    Returns:
+
+    - A list of the classified grid of each tile. With NumPy, each is a NumPy array of the same shape
+        as the tile. Otherwise, each is a row-major array.array of the class numbers (1 as the first class),
+        or of the class values if given, with 0 for nodata cells and cells outside the breaks.
+    """
+    usenumpy = _main._use_numpy(backend)
+    tiles = list(tiles)
+    if isinstance(breaks, str):
+        breaks = grid_breaks(tiles, breaks, nodata=nodata, backend=backend, **kwargs)
+    if isinstance(breaks, _main.BreakIndex):
+        breaks = breaks.breaks
+    breaks = [float(brk) for brk in breaks]
+    classes = len(breaks) - 1
+
+    if typecode is None:
+        typecode = "B" if classes < 2**8 else "H" if classes < 2**16 else "L"
+
+    # lookup of class values by class number, with the nodata value first
+    lookup = None
+    if classvalues is not None:
+        lookup = _main.class_values(classes, classvalues)
+        if nodatavalue is None:
+            nodatavalue = [0] * len(lookup[0]) if hasattr(lookup[0], "__iter__") else 0
+        lookup = [nodatavalue] + lookup
+
+    parallel = workers and workers > 1 and len(tiles) > 1
+    if parallel:
+        # memoryviews cannot be sent to the worker processes
+        tiles = [_picklable(tile, usenumpy) for tile in tiles]
+    jobs = [(tile, breaks, nodata, typecode, lookup, usenumpy) for tile in tiles]
+    if parallel:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            return pool.map(_classify_tile, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return [_classify_tile(job) for job in jobs]
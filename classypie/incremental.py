@@ -0,0 +1,292 @@
+"""
+Order-maintaining storage of classified items, so that items can be added and removed
+without sorting all the values again, along with versions of the breakpoint algorithms
+that are calculated directly from the sorted storage. Used by the Classifier in main.py
+when adding or removing items.
+"""
+
+from __future__ import division
+from . import stream as _stream
+import bisect
+
+
+
+class SortedItems(object):
+    """
+    A list of items kept sorted by their values, with fast insertion and removal.
+    Items are stored in buckets of limited size, each of which keeps the sum of
+    its values, so that positions, sums and counts above a value can be found
+    without visiting every item.
+
+    Iterating yields the items in order of their values.
+    """
+
+    load = 500
+
+    def __init__(self, items=(), values=()):
+        """
+        Args:
+
+        - **items** (optional): Initial items, already sorted by their values.
+        - **values** (optional): The values of the initial items, in increasing order.
+        """
+        items = list(items)
+        values = list(values)
+        self._shift = values[len(values) // 2] if values else 0.0
+        self._values = [values[i:i+self.load] for i in range(0, len(values), self.load)]
+        self._items = [items[i:i+self.load] for i in range(0, len(items), self.load)]
+        self._sums = [self._bucketsums(bucket) for bucket in self._values]
+        self._len = len(values)
+        self._offsets = None
+        # the values of each item object, for removing items whose values have since changed
+        self._lookup = {}
+        for item,val in zip(items, values):
+            self._lookup.setdefault(id(item), []).append(val)
+
+    def __repr__(self):
+        return "SortedItems(%r items)" % self._len
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._items:
+            for item in bucket:
+                yield item
+
+    def _bucketsums(self, bucket):
+        # sum and squared sum of a bucket, shifted for numerical stability
+        s1 = s2 = 0.0
+        for val in bucket:
+            val -= self._shift
+            s1 += val
+            s2 += val * val
+        return s1, s2
+
+    def _locate(self, value):
+        # the bucket where a value belongs
+        maxes = [bucket[-1] for bucket in self._values]
+        b = bisect.bisect_left(maxes, value)
+        return min(b, len(self._values) - 1)
+
+    def values(self):
+        """
+        Iterates over the values in increasing order.
+        """
+        for bucket in self._values:
+            for val in bucket:
+                yield val
+
+    def pairs(self):
+        """
+        Iterates over each item along with its value, in increasing order.
+        """
+        for values,items in zip(self._values, self._items):
+            for pair in zip(items, values):
+                yield pair
+
+    def add(self, item, value):
+        """
+        Inserts an item with the given value.
+        """
+        self._lookup.setdefault(id(item), []).append(value)
+        self._offsets = None
+        if not self._values:
+            self._shift = value
+            self._values.append([value])
+            self._items.append([item])
+            self._sums.append(self._bucketsums([value]))
+            self._len = 1
+            return
+        b = self._locate(value)
+        values,items = self._values[b],self._items[b]
+        i = bisect.bisect_right(values, value)
+        values.insert(i, value)
+        items.insert(i, item)
+        self._len += 1
+        if len(values) > 2 * self.load:
+            # split into two buckets
+            half = len(values) // 2
+            self._values[b:b+1] = [values[:half], values[half:]]
+            self._items[b:b+1] = [items[:half], items[half:]]
+            self._sums[b:b+1] = [self._bucketsums(values[:half]), self._bucketsums(values[half:])]
+        else:
+            self._sums[b] = self._bucketsums(values)
+
+    def remove(self, item, value=None):
+        """
+        Removes an item with the given value, or the value it had when it was added
+        if value is None. Items equal to the given item also count as a match.
+        Returns False if the item was not found.
+        """
+        if value is None:
+            added = self._lookup.get(id(item))
+            if not added:
+                return False
+            value = added[-1]
+        if not self._values:
+            return False
+        # prefer the same item object over equal ones
+        for match in (lambda other: other is item, lambda other: other == item):
+            b = self._locate(value)
+            while b < len(self._values):
+                values,items = self._values[b],self._items[b]
+                i = bisect.bisect_left(values, value)
+                while i < len(values) and values[i] == value:
+                    if match(items[i]):
+                        self._delete(b, i)
+                        return True
+                    i += 1
+                if i < len(values):
+                    break
+                # equal values may continue in the next bucket
+                b += 1
+        return False
+
+    def _delete(self, b, i):
+        values,items = self._values[b],self._items[b]
+        added = self._lookup[id(items[i])]
+        added.remove(values[i])
+        if not added:
+            del self._lookup[id(items[i])]
+        del values[i]
+        del items[i]
+        self._len -= 1
+        self._offsets = None
+        if values:
+            self._sums[b] = self._bucketsums(values)
+        else:
+            del self._values[b], self._items[b], self._sums[b]
+
+    def value_of(self, item):
+        """
+        Returns the value that an item object had when it was added.
+        Raises KeyError if the item is not found.
+        """
+        added = self._lookup.get(id(item))
+        if not added:
+            raise KeyError("Item not found")
+        return added[-1]
+
+    def value_at(self, index):
+        """
+        Returns the value at a position in the sorted order.
+        """
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("SortedItems index out of range")
+        if self._offsets is None:
+            # start position of each bucket, until the next change
+            self._offsets = [0]
+            for bucket in self._values[:-1]:
+                self._offsets.append(self._offsets[-1] + len(bucket))
+        b = bisect.bisect_right(self._offsets, index) - 1
+        return self._values[b][index - self._offsets[b]]
+
+    @property
+    def min(self):
+        return self._values[0][0]
+
+    @property
+    def max(self):
+        return self._values[-1][-1]
+
+    def sums(self):
+        """
+        Returns the sum and squared sum of all values, shifted by a constant
+        for numerical stability, along with the shift.
+        """
+        s1 = s2 = 0.0
+        for b1,b2 in self._sums:
+            s1 += b1
+            s2 += b2
+        return s1, s2, self._shift
+
+    def above(self, value):
+        """
+        Returns the number and sum of all values greater than or equal to a value.
+        """
+        count = 0
+        total = 0.0
+        b = self._locate(value)
+        bucket = self._values[b]
+        i = bisect.bisect_left(bucket, value)
+        count += len(bucket) - i
+        total += sum(bucket[i:])
+        for bucket,(b1,b2) in zip(self._values[b+1:], self._sums[b+1:]):
+            count += len(bucket)
+            total += b1 + self._shift * len(bucket)
+        return count, total
+
+    def accumulator(self):
+        """
+        Returns a stream.Accumulator with the summary statistics of all values.
+        """
+        acc = _stream.Accumulator()
+        if self._len:
+            s1, s2, shift = self.sums()
+            n = self._len
+            acc.n = n
+            acc.min = self.min
+            acc.max = self.max
+            acc.mean = shift + s1 / n
+            acc._m2 = max(0.0, s2 - s1 * s1 / n)
+        return acc
+
+
+
+# Algorithms for value breakpoints, calculated from the sorted storage
+
+def _quantile(sortedvals, classes=5):
+    n = len(sortedvals)
+    if n <= classes:
+        return list(sortedvals.values()) + [sortedvals.max]
+    breaks = []
+    for i in range(classes):
+        q = i / float(classes)
+        a = q * n
+        aa = int(q * n)
+        r = a - aa
+        Xq = (1 - r) * sortedvals.value_at(aa) + r * sortedvals.value_at(aa+1)
+        breaks.append(Xq)
+    breaks.append(sortedvals.max)
+    return breaks
+
+def _headtail(sortedvals, classes=5):
+    n = len(sortedvals)
+    if n == 1:
+        return [sortedvals.min] * 2
+    breaks = []
+    headsize, headsum = sortedvals.above(sortedvals.min)
+    while True:
+        m = headsum / float(headsize)
+        size, total = sortedvals.above(m)
+        if not headsize - size > size:
+            break
+        breaks.append(m)
+        if size > 1:
+            headsize, headsum = size, total
+        else:
+            break
+    breaks.insert(0, sortedvals.min)
+    breaks.append(sortedvals.max)
+    return breaks
+
+def _stdev(sortedvals, classes=5):
+    if len(sortedvals) <= classes:
+        return list(sortedvals.values()) + [sortedvals.max]
+    return _stream.stdev(sortedvals.accumulator(), classes=classes)
+
+def _summarized(name):
+    def func(sortedvals, **kwargs):
+        return _stream.algorithms[name](sortedvals.accumulator(), **kwargs)
+    return func
+
+algorithms = dict(histogram=_summarized("histogram"),
+                  equal=_summarized("equal"),
+                  log=_summarized("log"),
+                  pretty=_summarized("pretty"),
+                  stdev=_stdev,
+                  quantile=_quantile,
+                  headtail=_headtail)
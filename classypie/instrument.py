@@ -0,0 +1,119 @@
+"""
+Opt-in instrumentation of how long each stage of a classification takes and how much
+work it does, e.g. to find out why a classification is slow. Nothing is recorded
+unless a Profiler is active in the current thread, so there is almost no overhead otherwise.
+"""
+
+import threading
+import timeit
+
+_local = threading.local()
+_timer = timeit.default_timer
+
+
+
+def current():
+    """
+    Returns the Profiler that is active in the current thread, or None.
+    """
+    return getattr(_local, "profiler", None)
+
+class Profiler(object):
+    """
+    Records the time spent in each stage and a set of counters for all classifications
+    that run in the current thread while the profiler is active. Use as a context manager:
+
+        >>> with Profiler() as prof:
+        ...     result = breaks(values, "natural")
+        >>> print(prof.report())
+
+    The stages are:
+
+    - extract: Getting each item value with the key, converting to numbers, and filtering.
+    - sort: Sorting the items by their values.
+    - breaks: Calculating the break points with the algorithm.
+    - classify: Finding the class of each value.
+    - class_values: Interpolating the class values.
+
+    The counters are:
+
+    - items_seen: Number of items read.
+    - items_kept: Number of items left after filtering.
+    - dropped_nonnumeric, dropped_only, dropped_exclude, dropped_minval, dropped_maxval, dropped_weight:
+        Number of items dropped by each filter, only with the pure Python backend. NaN values are
+        dropped as non-numeric.
+    - values_classified: Number of values whose class was looked up.
+    - comparisons_estimate: Estimated number of comparisons with break points when
+        looking up classes, calculated from the number of values and breaks rather than counted.
+    - dp_cells: Number of cells evaluated in the natural breaks table.
+    - cache_hits, cache_misses: Number of breaks found and not found in the breaks cache, if enabled.
+
+    Attributes:
+
+    - timings: Dictionary of the total seconds spent in each stage.
+    - calls: Dictionary of the number of times each stage was entered.
+    - counters: Dictionary of the totals of each counter.
+    """
+
+    def __init__(self):
+        self.timings = dict()
+        self.calls = dict()
+        self.counters = dict()
+        self._previous = None
+
+    def __repr__(self):
+        return "Profiler(timings=%r, counters=%r)" % (self.timings, self.counters)
+
+    def __enter__(self):
+        self._previous = current()
+        _local.profiler = self
+        return self
+
+    def __exit__(self, *exc):
+        _local.profiler = self._previous
+        self._previous = None
+
+    def start(self):
+        """
+        Returns the start time of a stage, to be passed to `stop`.
+        """
+        return _timer()
+
+    def stop(self, stage, start):
+        """
+        Adds the time since start to the total of a stage.
+        """
+        elapsed = _timer() - start
+        self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def count(self, name, n=1):
+        """
+        Adds n to a counter.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def counted(self, iterable, name):
+        """
+        Iterates over an iterable while counting the number of elements.
+        """
+        n = 0
+        try:
+            for elem in iterable:
+                n += 1
+                yield elem
+        finally:
+            self.count(name, n)
+
+    def report(self):
+        """
+        Returns a readable table of the stage timings and counters.
+        """
+        lines = ["%-20s %10s %8s" % ("stage", "seconds", "calls")]
+        for stage in sorted(self.timings, key=self.timings.get, reverse=True):
+            lines.append("%-20s %10.6f %8d" % (stage, self.timings[stage], self.calls[stage]))
+        lines.append("")
+        lines.append("%-20s %10s" % ("counter", "total"))
+        for name in sorted(self.counters):
+            lines.append("%-20s %10d" % (name, self.counters[name]))
+        return "\n".join(lines)
@@ -4,8 +4,16 @@ Contains the main functionality for end-users.
 
 from __future__ import division
 from . import breaks as _breaks
+from . import vectorized as _vectorized
+from . import stream as _stream
+from . import incremental as _incremental
+from . import instrument as _instrument
+from . import cache as _cache
 import itertools
+import operator
 import math
+import bisect
+from array import array
 
 
 
@@ -27,6 +35,8 @@ class Classifier(object):
     - key: Function used to extract value from each item, defaults to None and treats item itself as the value.
     - kwargs: The kwargs to pass to the algorithm function.
             The algorithm functions and their arguments can be found in `classypie.breaks`.
+    - recompute: When to recalculate the breaks after items have been added or removed.
+            See `add`. 
     """
     
     def __init__(self, items, breaks, classvalues, key=None, **kwargs):
@@ -52,7 +62,8 @@ class Classifier(object):
             where a classvalue will be interpolated for each sequence number,
             and so all sequences must be equally long. Thus, specifying the
             classvalues as rgb color tuples will create interpolated color gradients.
-        - **key** (optional): Function used to extract value from each item, defaults to None and treats item itself as the value.
+        - **key** (optional): Function used to extract value from each item, or the name of a field or attribute of each item.
+        Defaults to None and treats item itself as the value.
         - **extrabreaks** (optional): Force insert additional break points. These are added to the original breakpoints,
             so if the classification resulted in 5 groupings, and you insert 2 additional break values, the final classification
             will contain 7 groupings. 
@@ -60,6 +71,15 @@ class Classifier(object):
         - **exclude** (optional): A list of values defining which values to exclude.
         - **minval** (optional): Sets the lower value boundary for the classification groupings, ignoring values below this threshold.
         - **maxval** (optional): Sets the upper value boundary for the classification groupings, ignoring values above this threshold.
+        - **weights** (optional): A list of weights for each item, or a function used to extract the weight from each item.
+            Each value then counts as many times as its weight, e.g. to classify pre-aggregated (value, count) pairs
+            or to weight values by area. Items with zero or negative weights are ignored. 
+        - **recompute** (optional): When to recalculate the breaks after items have been added or removed, 
+            either 'lazy' (default) to recalculate the next time the classifier is updated or iterated,
+            'always' to recalculate right away after each change, or an integer number of changes to
+            allow before the breaks of algorithms that cannot be updated incrementally (e.g. natural)
+            are recalculated. Until then, only the lowest and highest breaks are widened to include
+            added items outside the breaks. See `add`. 
         - **kwargs** (optional): Depending on the breaks algorithm used, any remaining kwargs are passed to the algorithm function.
             The algorithm functions and their arguments can be found in `classypie.breaks`.
         """
@@ -78,10 +98,19 @@ class Classifier(object):
         self.breaks = breaks
         self.classvalues = classvalues # the raw preinterpolated valuestops of the classvalues
         self.key = key
+        self.recompute = kwargs.pop("recompute", "lazy")
         self.kwargs = kwargs
         self.classvalues_interp = None # the final interpolated classvalues
+        self._index = None # compiled lookup of the breaks
 
-        self.update()
+        # cached results, see update()
+        self._prepared = None
+        self._numpy = False
+        self._sorted = None # sorted storage of the items once items are added or removed
+        self._edits = 0 # number of items added or removed since the breaks were calculated
+        self.invalidate()
+
+        self.update(force=False)
 
     def __repr__(self):
         import pprint
@@ -90,52 +119,303 @@ class Classifier(object):
                         classvalues_interp=self.classvalues_interp)
         return "Classifier object:\n" + pprint.pformat(metadict, indent=4)
 
-    def update(self):
+    def update(self, force=True):
         """
-        Force update/calculate breaks and class values based on the item values.
-        Automatically called when initiating the classifier, but can be useful for
-        recalculating if the classifier attributes have been modified. 
+        Update/calculate breaks and class values based on the item values.
+        Automatically called when initiating and iterating the classifier, but can be useful for
+        recalculating if the items or the classifier attributes have been modified. 
         Mostly used internally. 
+
+        By default the item values are extracted and sorted again and everything is recalculated,
+        e.g. after the contents of the items list has been modified in place. Use `add`, `remove`
+        and `update_item` instead to only recalculate what is affected by the changes. 
+
+        Args:
+
+        - **force** (optional): If False, only what has been invalidated by changes to the attributes
+            is recalculated, which is what iterating the classifier does. The extracted and sorted item
+            values are then kept between updates, and only extracted again if the items, key, or filtering
+            options are replaced. Breaks are only recalculated if the algorithm or its options change,
+            and class values only if the classvalues or number of classes change. Defaults to True. 
         """
-        # force update/calculate breaks and class values
+        # update/calculate breaks and class values
         # mostly used internally, though can be used to recalculate
         if self.algo == "unique":
             self.classvalues_interp = self.classvalues
+            return
+
+        if force:
+            self.invalidate()
 
-        elif self.algo == "proportional":
+        self._update_extraction()
+
+        if self._sorted is not None:
+            self._update_sorted()
+            return
+
+        items,values,weights = self._prepared
+
+        # calculate breaks
+        if self.algo == "proportional":
             self.classvalues_interp = [self.classvalues[0], self.classvalues[-1]]
-            items,values = zip(*rescale(self.items,
-                                       newmin=self.classvalues_interp[0],
-                                       newmax=self.classvalues_interp[-1],
-                                       key=self.key,
-                                       **self.kwargs))
-            itemvals = [self.key(item) for item in items]
+            if not len(values):
+                raise ValueError("Cannot rescale an empty sequence of values")
             if self.classvalues_interp[0] < self.classvalues_interp[-1]:
-                minval,maxval = min(itemvals), max(itemvals)
+                minval,maxval = min(values), max(values)
             else:
-                minval,maxval = max(itemvals), min(itemvals)
+                minval,maxval = max(values), min(values)
             self.breaks = [minval,maxval]
+            self._index = BreakIndex(self.breaks)
+            return
 
+        breaksig = self._breaksignature()
+        if breaksig != self._breaksig:
+            if self.algo != "custom":
+                algokwargs = dict(breaksig[1])
+                extrabreaks = algokwargs.pop("extrabreaks", None)
+                algokwargs.pop("stream", None)
+                self.breaks = _algorithm(self.algo, values, weights, numpy=self._numpy, **algokwargs)
+                if extrabreaks:
+                    _insert_extrabreaks(self.breaks, extrabreaks)
+            self._index = BreakIndex(self.breaks)
+            self._breaksig = breaksig
+
+        self._update_classvalues()
+
+    def _update_extraction(self):
+        # extract and sort values
+        proportional = self.algo == "proportional"
+        identity = (self.items, self.key, self.kwargs.get("weights"))
+        options = [proportional] + [_copy_option(self.kwargs.get(name)) for name in _extract_args if name != "weights"]
+        if (self._extraction is None
+            or any(old is not new for old,new in zip(self._extraction[0], identity))
+            or self._extraction[1] != options):
+            extractkwargs = dict((name,self.kwargs.get(name)) for name in _extract_args)
+            self._numpy = _use_numpy(extractkwargs.pop("backend")) and not proportional
+            if proportional:
+                # keep original order and apply the rescale filters
+                only,exclude = extractkwargs["only"], extractkwargs["exclude"]
+                self._prepared = _extract(self.items, self.key,
+                                          exclude=None if only else (exclude or None),
+                                          only=only or None)
+            else:
+                del extractkwargs["only"]
+                if self._numpy:
+                    self._prepared = _vectorized.prepare(self.items, _keyfunc(self.key), **extractkwargs)
+                else:
+                    self._prepared = _prepare(self.items, self.key, **extractkwargs)
+            self._extraction = (identity, options)
+            self._breaksig = None
+            self._sorted = None
+            self._edits = 0
+
+    def _update_sorted(self):
+        # update breaks from the sorted storage after items have been added or removed
+        sortedvals = self._sorted
+        if not len(sortedvals):
+            raise ValueError("Cannot classify an empty sequence of values")
+
+        if self.algo == "proportional":
+            self.classvalues_interp = [self.classvalues[0], self.classvalues[-1]]
+            if self.classvalues_interp[0] < self.classvalues_interp[-1]:
+                self.breaks = [sortedvals.min, sortedvals.max]
+            else:
+                self.breaks = [sortedvals.max, sortedvals.min]
+            self._index = BreakIndex(self.breaks)
+            return
+
+        breaksig = self._breaksignature()
+        if self.algo == "custom":
+            changed = breaksig != self._breaksig
+        elif breaksig != self._breaksig:
+            changed = True
+        elif self._edits and self.algo in _incremental.algorithms:
+            changed = True
+        elif self._edits:
+            # expensive to recalculate, so may allow a number of changes first
+            changed = not isinstance(self.recompute, int) or self._edits >= self.recompute
         else:
+            changed = False
+        if changed:
             if self.algo != "custom":
-                self.breaks = breaks(items=self.items,
-                                    algorithm=self.algo,
-                                    key=self.key,
-                                    **self.kwargs)
-            self.classvalues_interp = class_values(len(self.breaks)-1, # -1 because break values include edgevalues so will be one more in length
-                                                   self.classvalues)
+                algokwargs = dict(breaksig[1])
+                extrabreaks = algokwargs.pop("extrabreaks", None)
+                algokwargs.pop("stream", None)
+                func = _incremental.algorithms.get(self.algo)
+                if func:
+                    prof = _instrument.current()
+                    if prof: start = prof.start()
+                    self.breaks = func(sortedvals, **algokwargs)
+                    if prof: prof.stop("breaks", start)
+                else:
+                    values = array('d', sortedvals.values())
+                    self.breaks = _algorithm(self.algo, values, **algokwargs)
+                if extrabreaks:
+                    _insert_extrabreaks(self.breaks, extrabreaks)
+            self._index = BreakIndex(self.breaks)
+            self._breaksig = breaksig
+            self._edits = 0
+        elif self._edits and self.algo != "custom":
+            # until the breaks are recalculated, widen the outer breaks to fit added items
+            if sortedvals.min < self.breaks[0] or sortedvals.max > self.breaks[-1]:
+                self.breaks = list(self.breaks)
+                self.breaks[0] = min(self.breaks[0], sortedvals.min)
+                self.breaks[-1] = max(self.breaks[-1], sortedvals.max)
+                self._index = BreakIndex(self.breaks)
+
+        self._update_classvalues()
+
+    def _breaksignature(self):
+        # the algorithm options that the breaks depend on
+        if self.algo == "custom":
+            return (self.algo, list(self.breaks))
+        else:
+            return (self.algo, dict((name,_copy_option(val)) for name,val in self.kwargs.items()
+                                    if name not in _extract_args))
+
+    def _update_classvalues(self):
+        # interpolate class values
+        interpsig = (len(self.breaks)-1, _copy_option(self.classvalues)) # -1 because break values include edgevalues so will be one more in length
+        if interpsig != self._interpsig:
+            prof = _instrument.current()
+            if prof: start = prof.start()
+            self.classvalues_interp = class_values(interpsig[0], self.classvalues)
+            if prof: prof.stop("class_values", start)
+            self._interpsig = interpsig
+
+    def invalidate(self):
+        """
+        Forces all values, breaks and class values to be recalculated the next time the
+        classifier is iterated, e.g. after the contents of the items list has been modified in place. 
+        """
+        self._extraction = None
+        self._breaksig = None
+        self._interpsig = None
+        self._sorted = None
+
+    def add(self, items):
+        """
+        Adds items to the classification, without extracting and sorting the values
+        of all the other items again. Items are subject to the same filtering options
+        as the original items. 
+
+        After the first change the items are kept in a sorted storage (see
+        `incremental.SortedItems`), which becomes the classifier's items attribute
+        and is iterated in order of the item values. Each item can then be added or
+        removed in time proportional to the square root of the number of items. 
+        The equal, histogram, log, pretty, stdev, quantile, and headtail breaks are
+        recalculated from the sorted storage without visiting each item, while other
+        algorithms such as natural breaks are recalculated from scratch, as determined
+        by the recompute attribute. Until they are, the lowest and highest breaks are
+        widened so that added items outside the breaks still belong to the first or last class. 
+        Not supported for unique or weighted classifications. 
+
+        Args:
+
+        - **items**: A sequence of items or values to add. 
+        """
+        sortedvals = self._edit()
+        count = 0
+        for item,val,weight in self._edit_values(items):
+            sortedvals.add(item, val)
+            count += 1
+        self._edited(count)
+
+    def remove(self, items):
+        """
+        Removes items from the classification, see `add`. Items are found by identity,
+        or by equality with an item of the same value. Items that are not part of the
+        classification, e.g. because they were filtered out, are ignored. 
+
+        Args:
+
+        - **items**: A sequence of items or values to remove. 
+        """
+        sortedvals = self._edit()
+        count = 0
+        for item in items:
+            found = sortedvals.remove(item)
+            if not found:
+                for _,val,weight in self._edit_values([item]):
+                    found = sortedvals.remove(item, val)
+            if found:
+                count += 1
+        self._edited(count)
+
+    def update_item(self, item):
+        """
+        Moves an item to its new class after its value has been modified in place, see `add`.
+        The item is added if it was not yet part of the classification, and removed
+        if its new value is filtered out. 
+
+        Args:
+
+        - **item**: The modified item. 
+        """
+        sortedvals = self._edit()
+        sortedvals.remove(item)
+        for _,val,weight in self._edit_values([item]):
+            sortedvals.add(item, val)
+        self._edited(1)
+
+    def _edit(self):
+        # switch to the sorted storage before adding or removing items
+        if self.algo == "unique":
+            raise Exception("Adding or removing items is not supported for unique classifications")
+        if self.kwargs.get("weights") is not None:
+            raise Exception("Adding or removing items is not supported for weighted classifications")
+        self._update_extraction()
+        if self._sorted is None:
+            items,values,weights = self._prepared
+            if self._numpy:
+                values = values.tolist()
+            elif self.algo == "proportional":
+                # values are kept in their original order
+                order = sorted(range(len(values)), key=values.__getitem__)
+                items = [items[i] for i in order]
+                values = [values[i] for i in order]
+            self._sorted = _incremental.SortedItems(items, values)
+            self.items = self._sorted
+            identity,options = self._extraction
+            self._extraction = ((self._sorted,) + identity[1:], options)
+        return self._sorted
+
+    def _edit_values(self, items):
+        # the values of added items, filtered the same way as the original items
+        extractkwargs = dict((name,self.kwargs.get(name)) for name in ("exclude","minval","maxval","only"))
+        if self.algo == "proportional":
+            only,exclude = extractkwargs["only"], extractkwargs["exclude"]
+            return _values(items, self.key, exclude=None if only else (exclude or None), only=only or None)
+        else:
+            del extractkwargs["only"]
+            return _values(items, self.key, **extractkwargs)
+
+    def _edited(self, count):
+        # register changes and recalculate right away if needed
+        self._edits += count
+        if self.recompute == "always":
+            self.update(force=False)
 
     def __iter__(self):
         # loop and yield items along with their classnum and classvalue
         
         if self.algo == "unique":
             if isinstance(self.classvalues_interp, dict):
-                # only return specified uniqueval-classval pairs
-                for uid,subitems in unique(self.items, key=self.key, **self.kwargs):
-                    if uid in self.classvalues_interp:
-                        classval = self.classvalues_interp[uid]
-                        for item in subitems:
-                            yield item,classval
+                # only return specified uniqueval-classval pairs, without grouping any other items
+                kwargs = dict(self.kwargs)
+                only = kwargs.pop("only", None)
+                exclude = kwargs.pop("exclude", None)
+                wanted = set(self.classvalues_interp)
+                if only:
+                    wanted &= set(only)
+                elif exclude:
+                    wanted -= set(exclude)
+                if not wanted:
+                    return
+                for uid,subitems in unique(self.items, key=self.key, only=wanted, **kwargs):
+                    classval = self.classvalues_interp[uid]
+                    for item in subitems:
+                        yield item,classval
             else:
                 # eternally iterate over classvalues for each unique value
                 def classvalgen ():
@@ -147,24 +427,56 @@ class Classifier(object):
                     classval = next(classvalgen)
                     for item in subitems:
                         yield item,classval
+            return
 
-        elif self.algo == "proportional":
-            for item,newval in rescale(self.items,
-                                       newmin=self.classvalues_interp[0],
-                                       newmax=self.classvalues_interp[-1],
-                                       key=self.key,
-                                       **self.kwargs):
-                yield item,newval
+        # make sure nothing has changed since last update
+        self.update(force=False)
+
+        if self._sorted is not None:
+            if self.algo == "proportional":
+                newval = _rescaler(self._sorted.min, self._sorted.max, self.classvalues_interp[0], self.classvalues_interp[-1])
+                for item,val in self._sorted.pairs():
+                    yield item,newval(val)
+            else:
+                classify = self._index.classify
+                for item,val in self._sorted.pairs():
+                    classnum = classify(val)
+                    if classnum is not None:
+                        yield item,self.classvalues_interp[classnum-1]
+            return
+        
+        items,values,weights = self._prepared
+
+        if self.algo == "proportional":
+            oldmin,oldmax = min(values),max(values)
+            newval = _rescaler(oldmin, oldmax, self.classvalues_interp[0], self.classvalues_interp[-1])
+            for item,val in zip(items, values):
+                yield item,newval(val)
 
         else:
-            for valrange,subitems in split(self.items, self.breaks, key=self.key, **self.kwargs):
-                midval = (valrange[0] + valrange[1]) / 2.0
-                classinfo = self.find_class(midval)
-                if classinfo is not None:
-                    classnum,_ = classinfo
-                    classval = self.classvalues_interp[classnum-1] # index is zero-based while find_class returns 1-based
-                    for item in subitems:
-                        yield item,classval
+            for classnum,start,end in _classify_sorted(values, self._index, self._numpy):
+                classval = self.classvalues_interp[classnum-1] # index is zero-based while class numbers are 1-based
+                for item in items[start:end]:
+                    yield item,classval
+
+    def __aiter__(self):
+        # iterate with async for, see aio.aiterate (Python 3.6+)
+        from . import aio
+        return aio.aiterate(self)
+
+    def palette(self, typecode="B", nodatavalue=None):
+        """
+        Returns the interpolated class values as a `Palette` lookup table, to color the class
+        numbers of items, e.g. as returned by `classify` with this classifier's breaks.
+
+        Args:
+
+        - **typecode**, **nodatavalue** (optional): See `Palette`.
+        """
+        if self.algo in ("unique", "proportional"):
+            raise Exception("Palettes are not supported for '%s' classifications" % self.algo)
+        self.update(force=False)
+        return Palette(self.classvalues_interp, typecode, nodatavalue)
 
     def find_class(self, value):
         """
@@ -185,24 +497,816 @@ class Classifier(object):
             enclosing breakpoint values. If value is outside the scope of all breakpoints,
             returns None.
         """
-        return find_class(value, self.breaks)
+        return find_class(value, self._index)
+
+
+class MultiClassifier(object):
+    """
+    Manages several classifications of the same set of items, e.g. one for each
+    visual variable of a map layer. The item values are extracted, filtered and sorted
+    only once and shared by all the classifications, and iterating the classifier
+    yields each item along with the class values of all the classifications at once,
+    as a dictionary of class values by classification name. Classifications that
+    an item falls outside of are left out of its dictionary. Unlike `Classifier`, 
+    proportional classifications also use the shared filtering options. 
+
+    Attributes:
+
+    - items: The list of items or values managed by the classifier.
+    - key: Function used to extract value from each item, defaults to None and treats item itself as the value.
+    - kwargs: The value filtering options shared by all the classifications.
+    - names: The names of the classifications, in the order they were added.
+    - classifications: A dictionary of the classifications by name, each with the same
+        algo, breaks, classvalues, classvalues_interp, and kwargs attributes as a `Classifier`. 
+    """
+
+    def __init__(self, items, key=None, **kwargs):
+        """
+        Args:
+
+        - **items**: The list of items or values to classify.
+        - **key** (optional): Function used to extract value from each item, or the name of a field or attribute of each item.
+        Defaults to None and treats item itself as the value.
+        - **kwargs** (optional): Options for which values to classify, shared by all the classifications: 
+            exclude, minval, maxval, weights, presorted, and backend. See `Classifier`. 
+        """
+        for name in kwargs:
+            if name not in _extract_args or name == "only":
+                raise Exception("Unknown MultiClassifier option '%s', algorithm options should be given to add_classification" % name)
+        self.items = items
+        self.key = key
+        self.kwargs = kwargs
+        self.names = []
+        self.classifications = dict()
+
+        # cached results, see update()
+        self._prepared = None
+        self._numpy = False
+        self._extraction = None
+
+    def __repr__(self):
+        import pprint
+        metadict = dict((name, dict(algo=self.classifications[name].algo,
+                                    breaks=self.classifications[name].breaks,
+                                    classvalues_interp=self.classifications[name].classvalues_interp))
+                        for name in self.names)
+        return "MultiClassifier object:\n" + pprint.pformat(metadict, indent=4)
+
+    def add_classification(self, name, breaks, classvalues, **kwargs):
+        """
+        Adds a named classification of the items, and calculates its breaks and class values.
+
+        Args:
+
+        - **name**: The name of the classification, used as the key for its class values when iterating. 
+        - **breaks**: List of custom break values, or the name of the algorithm to use,
+            as for `Classifier`. The 'unique' algorithm is not supported. 
+        - **classvalues**: A gradient of symbolic values to assign to each of the classes, as for `Classifier`.
+        - **kwargs** (optional): Any remaining kwargs are passed to the algorithm function, e.g. classes or extrabreaks. 
+        """
+        if isinstance(breaks, str):
+            if breaks == "unique":
+                raise Exception("The unique algorithm is not supported by MultiClassifier")
+            algo,breaks = breaks,None
+        else:
+            algo = "custom"
+        classification = _Classification(algo, breaks, classvalues, kwargs)
+        if name not in self.classifications:
+            self.names.append(name)
+        self.classifications[name] = classification
+        self.update()
+
+    def remove_classification(self, name):
+        """
+        Removes a named classification. 
+        """
+        self.names.remove(name)
+        del self.classifications[name]
+
+    def update(self):
+        """
+        Update/calculate the breaks and class values of all the classifications.
+        The values are only extracted and sorted again if the items, key, or filtering
+        options change, and each classification is only recalculated if its own
+        attributes change. If the contents of the items list is modified in place,
+        call `invalidate` first. 
+        """
+        identity = (self.items, self.key, self.kwargs.get("weights"))
+        options = [_copy_option(self.kwargs.get(name)) for name in _extract_args if name not in ("only", "weights")]
+        if (self._extraction is None
+            or any(old is not new for old,new in zip(self._extraction[0], identity))
+            or self._extraction[1] != options):
+            extractkwargs = dict((name,self.kwargs.get(name)) for name in _extract_args if name != "only")
+            self._numpy = _use_numpy(extractkwargs.pop("backend"))
+            if self._numpy:
+                self._prepared = _vectorized.prepare(self.items, _keyfunc(self.key), **extractkwargs)
+            else:
+                self._prepared = _prepare(self.items, self.key, **extractkwargs)
+            self._extraction = (identity, options)
+            for classification in self.classifications.values():
+                classification._breaksig = None
+
+        items,values,weights = self._prepared
+        for name in self.names:
+            self.classifications[name].update(values, weights, self._numpy)
+
+    def invalidate(self):
+        """
+        Forces all values, breaks and class values to be recalculated on the next update,
+        e.g. after the contents of the items list has been modified in place. 
+        """
+        self._extraction = None
+
+    def __iter__(self):
+        # loop and yield items along with the classvalues of each classification
+        self.update()
+        items,values,weights = self._prepared
+
+        # class values of each sorted position, None for misses
+        columns = []
+        for name in self.names:
+            classification = self.classifications[name]
+            column = [None] * len(items)
+            if classification.algo == "proportional":
+                cv = classification.classvalues_interp
+                newval = _rescaler(values[0], values[-1], cv[0], cv[-1])
+                for i,val in enumerate(values):
+                    column[i] = newval(val)
+            else:
+                for classnum,start,end in _classify_sorted(values, classification._index, self._numpy):
+                    column[start:end] = [classification.classvalues_interp[classnum-1]] * (end - start)
+            columns.append((name, column))
+
+        for i,item in enumerate(items):
+            info = dict((name,column[i]) for name,column in columns if column[i] is not None)
+            yield item,info
+
+class _Classification(object):
+    # the breaks and class values of one classification in a MultiClassifier
+    def __init__(self, algo, breaks, classvalues, kwargs):
+        self.algo = algo
+        self.breaks = breaks
+        self.classvalues = classvalues
+        self.kwargs = kwargs
+        self.classvalues_interp = None
+        self._index = None
+        self._breaksig = None
+        self._interpsig = None
+
+    def __repr__(self):
+        return "Classification(algo=%r, breaks=%r)" % (self.algo, self.breaks)
+
+    def update(self, values, weights, numpy):
+        if not len(values):
+            raise ValueError("Cannot classify an empty sequence of values")
+        if self.algo == "proportional":
+            self.classvalues_interp = [self.classvalues[0], self.classvalues[-1]]
+            if self.classvalues_interp[0] < self.classvalues_interp[-1]:
+                self.breaks = [float(values[0]), float(values[-1])]
+            else:
+                self.breaks = [float(values[-1]), float(values[0])]
+            return
+
+        if self.algo == "custom":
+            breaksig = (self.algo, list(self.breaks))
+        else:
+            breaksig = (self.algo, dict((name,_copy_option(val)) for name,val in self.kwargs.items()))
+        if breaksig != self._breaksig:
+            if self.algo != "custom":
+                algokwargs = dict(self.kwargs)
+                extrabreaks = algokwargs.pop("extrabreaks", None)
+                self.breaks = _algorithm(self.algo, values, weights, numpy=numpy, **algokwargs)
+                if extrabreaks:
+                    _insert_extrabreaks(self.breaks, extrabreaks)
+            self._index = BreakIndex(self.breaks)
+            self._breaksig = breaksig
+
+        interpsig = (len(self.breaks)-1, _copy_option(self.classvalues))
+        if interpsig != self._interpsig:
+            prof = _instrument.current()
+            if prof: start = prof.start()
+            self.classvalues_interp = class_values(interpsig[0], self.classvalues)
+            if prof: prof.stop("class_values", start)
+            self._interpsig = interpsig
 
 
 ################################
+
+def _use_numpy(backend):
+    # determine whether to use the numpy backend
+    if backend is None or backend == "auto":
+        return _vectorized.numpy is not None
+    elif backend == "numpy":
+        if _vectorized.numpy is None:
+            raise Exception("The numpy backend requires NumPy to be installed")
+        return True
+    elif backend == "python":
+        return False
+    else:
+        raise Exception("Unknown backend '%s', must be one of 'auto', 'numpy' or 'python'" % backend)
+
+def _keyfunc(key):
+    # resolve a key to a function
+    # a string key is the name of a field or attribute, resolved from the first item
+    if not isinstance(key, str):
+        return key
+    getters = [operator.itemgetter(key), operator.attrgetter(key)]
+    resolved = []
+    def keyfunc(item):
+        if resolved:
+            return resolved[0](item)
+        for getter in getters:
+            try:
+                val = getter(item)
+            except (KeyError, IndexError, TypeError, AttributeError):
+                continue
+            resolved.append(getter)
+            return val
+        raise Exception("Items have no field or attribute named '%s'" % key)
+    return keyfunc
+
+def _values(items, key=None, exclude=None, minval=None, maxval=None, only=None, weights=None):
+    # iterate over each item along with its numeric value and weight, skipping
+    # items that are filtered out. the key and weight are evaluated only once per item
+    key = _keyfunc(key)
+    if exclude is not None:
+        if not isinstance(exclude, (list,tuple,set)): exclude = [exclude]
+        exclude = set(exclude)
+    if only is not None:
+        only = set(only)
+
+    # pair items with weights
+    weighted = weights is not None
+    if not weighted:
+        pairs = ((item,1.0) for item in items)
+    elif callable(weights):
+        pairs = ((item,weights(item)) for item in items)
+    else:
+        items = list(items)
+        weights = list(weights)
+        if len(weights) != len(items):
+            raise Exception("The number of weights must be the same as the number of items")
+        pairs = zip(items, weights)
+
+    prof = _instrument.current()
+    if prof:
+        pairs = prof.counted(pairs, "items_seen")
+
+    for item,weight in pairs:
+        # ensure values are numeric, errors in the key itself are raised
+        val = key(item) if key else item
+        try:
+            val = float(val)
+        except (TypeError, ValueError, OverflowError):
+            if prof: prof.count("dropped_nonnumeric")
+            continue
+        if val != val:
+            # nan, missing the same as non-numeric values
+            if prof: prof.count("dropped_nonnumeric")
+            continue
+        if only is not None and val not in only:
+            if prof: prof.count("dropped_only")
+            continue
+        if exclude is not None and val in exclude:
+            if prof: prof.count("dropped_exclude")
+            continue
+        if minval is not None and val < minval:
+            if prof: prof.count("dropped_minval")
+            continue
+        if maxval is not None and val > maxval:
+            if prof: prof.count("dropped_maxval")
+            continue
+        if weighted:
+            # only positive weights count
+            try:
+                weight = float(weight)
+            except:
+                weight = 0
+            if not weight > 0:
+                if prof: prof.count("dropped_weight")
+                continue
+        yield item, val, weight
+
+def _extract(items, key=None, exclude=None, minval=None, maxval=None, only=None, weights=None):
+    # extract and filter the items and their values (and weights) in a single pass
+    # returns the items list, values array, and weights array (None if not weighted)
+    prof = _instrument.current()
+    if prof: start = prof.start()
+    if key is None and weights is None and _buffer_format(items) is not None:
+        # items are the values, read directly as numbers and kept in the same typed form
+        kept = _buffer_items(items, exclude, minval, maxval, only)
+        if kept.typecode in "fd" and _hasnan(kept):
+            kept = array(kept.typecode, [val for val in kept if val == val])
+        values = kept if kept.typecode == "d" else array('d', kept)
+        if prof:
+            prof.stop("extract", start)
+            prof.count("items_seen", len(items))
+            prof.count("items_kept", len(values))
+        return kept, values, None
+    kept = []
+    values = array('d')
+    weighted = array('d') if weights is not None else None
+    for item,val,weight in _values(items, key, exclude, minval, maxval, only, weights):
+        kept.append(item)
+        values.append(val)
+        if weighted is not None:
+            weighted.append(weight)
+    if prof:
+        prof.stop("extract", start)
+        prof.count("items_kept", len(values))
+    return kept, values, weighted
+
+def _prepare(items, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False):
+    # extract, filter and sort the items by their values
+    # returns the sorted items list, values array, and weights array (None if not weighted)
+    items, values, weights = _extract(items, key, exclude, minval, maxval, weights=weights)
+
+    if presorted and all(prev <= nxt for prev,nxt in zip(values, itertools.islice(values, 1, None))):
+        # already in order
+        return items, values, weights
+
+    prof = _instrument.current()
+    if prof: start = prof.start()
+    if items is values:
+        # items are the values, so can be sorted directly
+        values = array('d', sorted(values))
+        if prof: prof.stop("sort", start)
+        return values, values, weights
+    if isinstance(items, array):
+        # typed numbers of a buffer, which sort in the same order as their values
+        values = array('d', sorted(values))
+        items = array(items.typecode, sorted(items))
+        if prof: prof.stop("sort", start)
+        return items, values, weights
+    order = sorted(range(len(values)), key=values.__getitem__)
+    items = [items[i] for i in order]
+    values = array('d', [values[i] for i in order])
+    if weights is not None:
+        weights = array('d', [weights[i] for i in order])
+    if prof: prof.stop("sort", start)
+    return items, values, weights
+
+def _poskey(key):
+    # key function for (position, item) pairs
+    keyfunc = _keyfunc(key)
+    if keyfunc:
+        return lambda pair: keyfunc(pair[1])
+    else:
+        return operator.itemgetter(1)
+
+def _argprepare(items, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False):
+    # same as _prepare, but instead of sorting the items returns the list of all the items
+    # and an array of the indexes of the kept items in sorted order
+    if not isinstance(items, (list, tuple)):
+        items = list(items)
+    poskey = _poskey(key)
+    if callable(weights):
+        posweights = lambda pair, weights=weights: weights(pair[1])
+    else:
+        posweights = weights
+    positions, values, weights = _extract(enumerate(items), poskey, exclude, minval, maxval, weights=posweights)
+
+    if presorted and all(prev <= nxt for prev,nxt in zip(values, itertools.islice(values, 1, None))):
+        # already in order
+        return items, array('l', [pos for pos,item in positions]), values, weights
+
+    prof = _instrument.current()
+    if prof: start = prof.start()
+    order = sorted(range(len(values)), key=values.__getitem__)
+    indexes = array('l', [positions[i][0] for i in order])
+    values = array('d', [values[i] for i in order])
+    if weights is not None:
+        weights = array('d', [weights[i] for i in order])
+    if prof: prof.stop("sort", start)
+    return items, indexes, values, weights
+
+def _stream_values(items, key=None, exclude=None, minval=None, maxval=None):
+    # iterate over the numeric and filtered item values in a single pass
+    if (key is None and exclude is None and minval is None and maxval is None
+        and _buffer_format(items) == "d" and not _hasnan(items)):
+        # float buffers can be read directly
+        return items
+    return _stream_items(items, key, exclude, minval, maxval)
+
+def _stream_items(items, key=None, exclude=None, minval=None, maxval=None):
+    for item,val,weight in _values(items, key, exclude, minval, maxval):
+        yield val
+
+# buffer formats of numbers that can be read directly
+_numeric_formats = "bBhHiIlLqQfd"
+
+def _buffer_format(items):
+    # returns the format code if items is an array or one-dimensional memoryview of numbers, otherwise None
+    if isinstance(items, array):
+        if items.typecode in _numeric_formats:
+            return items.typecode
+    elif isinstance(items, memoryview):
+        if items.format in _numeric_formats and items.ndim == 1:
+            return items.format
+    return None
+
+def _hasnan(values):
+    # whether a float buffer contains nan, summed in C rather than checking each value
+    total = sum(values)
+    return total != total
+
+def _buffer_items(items, exclude=None, minval=None, maxval=None, only=None):
+    # array of the filtered numbers of a numeric buffer with the same typecode as the buffer,
+    # without converting each number in python, and without copying if already an array
+    # and nothing is filtered
+    fmt = _buffer_format(items)
+    if isinstance(items, array):
+        kept = items
+    else:
+        kept = array(fmt)
+        if hasattr(kept, "frombytes"):
+            kept.frombytes(items.cast("B") if items.c_contiguous else items.tobytes())
+        else:
+            kept.fromstring(items.tobytes())
+
+    if exclude is not None:
+        if not isinstance(exclude, (list,tuple,set)): exclude = [exclude]
+        exclude = set(exclude)
+    if only is not None:
+        only = set(only)
+    if only is not None or exclude is not None or minval is not None or maxval is not None:
+        kept = array(fmt, [val for val in kept
+                           if (only is None or val in only)
+                           and (exclude is None or val not in exclude)
+                           and (minval is None or val >= minval)
+                           and (maxval is None or val <= maxval)])
+    return kept
+
+def _buffer_values(items, exclude=None, minval=None, maxval=None, only=None):
+    # float array of the filtered values of a numeric buffer, see _buffer_items
+    kept = _buffer_items(items, exclude, minval, maxval, only)
+    return kept if kept.typecode == "d" else array("d", kept)
+
+# options that affect which values are extracted
+_extract_args = ("exclude", "minval", "maxval", "only", "weights", "presorted", "backend")
+
+def _copy_option(val):
+    # copy of an option value for detecting later changes,
+    # sequences are compared by their values and anything else by identity
+    if isinstance(val, (list, tuple)):
+        return [_copy_option(v) for v in val]
+    elif val is None or isinstance(val, (int, float, str)):
+        return val
+    else:
+        return _Identity(val)
+
+class _Identity(object):
+    # compares equal only to the same object
+    def __init__(self, obj):
+        self.obj = obj
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and self.obj is other.obj
+    def __ne__(self, other):
+        return not self == other
+
+# algorithms that do not need sorted values
+_single_pass = ("histogram", "equal", "log", "pretty", "stdev")
+
+def _insert_extrabreaks(breaks, extrabreaks):
+    # insert extra breaks (list of single break values or pairs) in place
+    for val in extrabreaks:
+        oldbreaks = list(breaks)
+        
+        # insert single break value anywhere after first same or greater breakpoint
+        # (remember that duplicate breakpoints will collect only that specific value)
+        prevbrk = oldbreaks[0]
+        i = 0
+        for nextbrk in oldbreaks[1:]:
+            if prevbrk <= val < nextbrk:
+                breaks.insert(i, val)
+                break
+            else:
+                prevbrk = nextbrk
+            i += 1
+
+def _classify_sorted(values, index, numpy=False):
+    # iterate over the class number and start and end index of each class in
+    # an array of sorted values, skipping values outside the breaks
+    prof = _instrument.current()
+    if prof: start = prof.start()
+    if numpy:
+        if index.ordered:
+            classnums = _vectorized.classify(values, index.breaks)
+        else:
+            classnums = [classnum or 0 for classnum in index.classify_many(values.tolist())]
+    else:
+        classnums = index.classify_many(values)
+    if prof:
+        prof.stop("classify", start)
+        prof.count("values_classified", len(values))
+        # estimated from the number of values and breaks rather than counted
+        if index.ordered:
+            # up to two binary searches per value
+            prof.count("comparisons_estimate", len(values) * 2 * len(index.breaks).bit_length())
+        else:
+            prof.count("comparisons_estimate", len(values) * len(index.breaks))
+
+    if numpy:
+        for classnum,start,end in _vectorized.groups(classnums):
+            if classnum != 0:
+                yield classnum, start, end
+        
+    else:
+        i = 0
+        for classnum,group in itertools.groupby(classnums):
+            size = sum(1 for _ in group)
+            if classnum is not None:
+                yield classnum, i, i+size
+            i += size
+
+def _rescaler(oldmin, oldmax, newmin, newmax):
+    # returns a function that linearly rescales a value from the old to the new range
+    # the ranges are calculated once, rather than for every value
+
+    # determine appropriate interp func for either sequenes or single values
+
+    if oldmin == oldmax:
+        # special case, only one value, return max newval
+        def newval(val):
+            return newmax
+    elif hasattr(newmin, "__iter__") and hasattr(newmax, "__iter__"):
+        # tuples of eg colors
+        if len(newmin) != len(newmax):
+            raise Exception("If newmin/newmax are sequences they must both have the same length")
+        oldrange = float(oldmax - oldmin)
+        newranges = [(ifromval, itoval - ifromval) for ifromval,itoval in zip(newmin,newmax)]
+        def newval(val):
+            relval = (val - oldmin) / oldrange
+            return [ifromval + inewrange * relval for ifromval,inewrange in newranges]
+    else:
+        oldrange = float(oldmax - oldmin)
+        newrange = newmax - newmin
+        def newval(val):
+            return newmin + newrange * ((val - oldmin) / oldrange)
+
+    return newval
+
+def _algorithm(name, values, weights=None, numpy=False, **kwargs):
+    # calculate breaks for the prepared values with the named algorithm,
+    # or look them up if the breaks cache is enabled
+    if _cache.enabled():
+        return _cache.cached(_calculate, name, values, weights, numpy, **kwargs)
+    return _calculate(name, values, weights, numpy, **kwargs)
+
+def _calculate(name, values, weights=None, numpy=False, **kwargs):
+    # calculate breaks for the prepared values with the named algorithm
+    func = None
+    if numpy:
+        func = _vectorized.algorithms.get(name)
+        if func is None:
+            # fall back to pure python algorithm
+            values = values.tolist()
+            if weights is not None:
+                weights = weights.tolist()
+    if func is None:
+        func = _breaks.__dict__[name]
+    if weights is not None:
+        kwargs["weights"] = weights
+    prof = _instrument.current()
+    if prof:
+        start = prof.start()
+        breaks = func(values, **kwargs)
+        prof.stop("breaks", start)
+        return breaks
+    return func(values, **kwargs)
             
 
+class BreakIndex(object):
+    """
+    A compiled lookup structure for a list of breakpoints, for quickly finding the class
+    that many values belong to. Lookups use binary search and so take O(log k) time,
+    where k is the number of breakpoints.
+
+    Values follow the same rules as `split`: a value belongs to the class where
+    lower break <= value < upper break, except the last class which also includes its upper break.
+    Classes with identical lower and upper breaks collect only that exact value. Values
+    lower or higher than the break endpoints are misses. 
+
+    Attributes:
+
+    - breaks: The list of break points that define the class groupings.
+    - ordered: Whether the breaks are in increasing order. Some algorithms can produce
+        breaks slightly out of order near the endpoints, in which case lookups fall back
+        to checking each class in turn. 
+    """
+
+    def __init__(self, breaks):
+        """
+        Args:
+
+        - **breaks**: A list of break points in increasing order that define the class groupings.
+        """
+        self.breaks = [float(brk) for brk in breaks]
+        if len(self.breaks) < 2:
+            raise Exception("There must be at least two breakpoints to define a class")
+        self._ranges = list(zip(breaks[:-1], breaks[1:]))
+        self.ordered = all(prevbrk <= nextbrk for prevbrk,nextbrk in zip(self.breaks[:-1], self.breaks[1:]))
+        if not self.ordered:
+            # binary search is not possible, fall back to checking each class in turn
+            self.classify = self._classify_linear
+
+    def __repr__(self):
+        return "BreakIndex(%r)" % self.breaks
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def classify(self, value):
+        """
+        Finds the class number of a single value.
+
+        Args:
+
+        - **value**: The value for which to find the class.
+
+        Returns:
+
+        - The class number (1 as the first class), or None if the value is outside
+            the scope of all breakpoints. 
+        """
+        breaks = self.breaks
+        i = bisect.bisect_right(breaks, value)
+        if i == 0:
+            # lower than first break
+            return None
+        if breaks[i-1] == value:
+            # exactly on a break, the first class collapsed to this value takes precedence
+            j = bisect.bisect_left(breaks, value, 0, i)
+            if j + 1 < i:
+                return j + 1
+        if i == len(breaks):
+            # inclusive upper end of last class
+            if value == breaks[-1]:
+                return i - 1
+            return None
+        return i
+
+    def _classify_linear(self, value):
+        breaks = self.breaks
+        last = len(breaks) - 1
+        for i in range(1, len(breaks)):
+            prevbrk,nextbrk = breaks[i-1],breaks[i]
+            if value < prevbrk:
+                return None
+            elif prevbrk <= value < nextbrk:
+                return i
+            elif prevbrk == value == nextbrk:
+                return i
+            elif i == last and value <= nextbrk:
+                return i
+        return None
+
+    def classify_many(self, values):
+        """
+        Finds the class number of each value in a sequence of values.
+
+        Args:
+
+        - **values**: A sequence or iterable of values. 
+
+        Returns:
+
+        - A list of class numbers (1 as the first class) for each value, with None
+            for values outside the scope of all breakpoints. 
+        """
+        classify = self.classify
+        return [classify(val) for val in values]
+
+    def find(self, value):
+        """
+        Same as `classify`, but also returns the two enclosing breakpoint values.
+
+        Returns:
+
+        - A tuple of the class number (1 as the first class) and the two
+            enclosing breakpoint values, or None if the value is outside the
+            scope of all breakpoints.
+        """
+        classnum = self.classify(value)
+        if classnum is None:
+            return None
+        return classnum, self._ranges[classnum-1]
+
+    def range(self, classnum):
+        """
+        Returns the lower and upper breakpoint values of a class number (1 as the first class). 
+        """
+        return self._ranges[classnum-1]
+
+class RangeIndex(object):
+    """
+    A compiled lookup structure for a list of possibly overlapping min-max ranges, for quickly
+    finding all the ranges that a value belongs to, e.g. for membership groupings of streamed items.
+    The ranges are stored in a centered interval tree, so that lookups take O(log m + r) time,
+    where m is the number of ranges and r is the number of matching ranges.
+
+    A value belongs to a range if min <= value <= max.
+
+    Attributes:
+
+    - ranges: The list of min-max tuples.
+    """
+
+    def __init__(self, ranges):
+        """
+        Args:
+
+        - **ranges**: A list of min-max tuples defining the lower and upper bounds of each range.
+        """
+        self.ranges = [(_min,_max) for _min,_max in ranges]
+        # inverted ranges cannot contain any values
+        self._tree = self._build([i for i,(_min,_max) in enumerate(self.ranges) if _min <= _max])
+
+    def __repr__(self):
+        return "RangeIndex(%r)" % self.ranges
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def _build(self, indexes):
+        # each node is a center value, the ranges containing it sorted by min and by max,
+        # and the nodes of the ranges entirely below and above it
+        if not indexes:
+            return None
+        ranges = self.ranges
+        bounds = sorted(bound for i in indexes for bound in ranges[i])
+        center = bounds[len(bounds) // 2]
+        below, above, overlapping = [], [], []
+        for i in indexes:
+            _min,_max = ranges[i]
+            if _max < center:
+                below.append(i)
+            elif _min > center:
+                above.append(i)
+            else:
+                overlapping.append(i)
+        bymin = sorted(overlapping, key=lambda i: ranges[i][0])
+        bymax = sorted(overlapping, key=lambda i: ranges[i][1], reverse=True)
+        return center, bymin, bymax, self._build(below), self._build(above)
+
+    def find_indexes(self, value):
+        """
+        Finds the positions of all the ranges that contain a value, in the order of the ranges.
+        """
+        ranges = self.ranges
+        found = []
+        node = self._tree
+        while node is not None:
+            center, bymin, bymax, below, above = node
+            if value < center:
+                for i in bymin:
+                    if ranges[i][0] > value:
+                        break
+                    found.append(i)
+                node = below
+            elif value > center:
+                for i in bymax:
+                    if ranges[i][1] < value:
+                        break
+                    found.append(i)
+                node = above
+            else:
+                found.extend(bymin)
+                break
+        found.sort()
+        return found
+
+    def find(self, value):
+        """
+        Finds all the ranges that contain a value.
+
+        Args:
+
+        - **value**: The value for which to find the ranges.
+
+        Returns:
+
+        - A list of the min-max tuples of the ranges that contain the value, in the order of the ranges. 
+        """
+        ranges = self.ranges
+        return [ranges[i] for i in self.find_indexes(value)]
+
 def find_class(value, breaks):
     """
     Given a set of breakpoints, calculate which two breakpoints an input
     value is located between, returning the class number (1 as the first class)
     and the two enclosing breakpoint values. A value that is not between any of
     the breakpoints, ie larger or smaller than the break endpoints, is considered
-    to be a miss and returns None.
+    to be a miss and returns None. Values exactly on a breakpoint belong to the
+    class above it, except for the last breakpoint, following the same rules as `split`.
+
+    For classifying many values against the same breakpoints it is much faster
+    to create a `BreakIndex` once and reuse it.
 
     Args:
 
     - **value**: The value for which to find the class. 
-    - **breaks**: A list of break points that define the class groupings.
+    - **breaks**: A list of break points that define the class groupings, or a `BreakIndex`.
 
     Returns:
 
@@ -210,17 +1314,9 @@ def find_class(value, breaks):
         enclosing breakpoint values. If value is outside the scope of all breakpoints,
         returns None. 
     """
-    
-    prevbrk = breaks[0]
-    classnum = 1
-    for nextbrk in breaks[1:]:
-        if eval(str(prevbrk)) <= eval(str(value)) <= eval(str(nextbrk)):
-            return classnum, (prevbrk,nextbrk)
-        prevbrk = nextbrk
-        classnum += 1
-    else:
-        # Value was not within the range of the break points
-        return None
+    if not isinstance(breaks, BreakIndex):
+        breaks = BreakIndex(breaks)
+    return breaks.find(float(value))
 
 def class_values(classes, valuestops):
     """
@@ -257,6 +1353,10 @@ def class_values(classes, valuestops):
 
     - A list of values the length of the number of classes, linearly interpolated between the input valuestops. 
     """
+    return _cache.cached_class_values(_class_values, classes, valuestops)
+
+def _class_values(classes, valuestops):
+    # interpolate the class values, see class_values
     # special case
     if classes <= 1:
         #raise Exception("Number of classes must be higher than 1")
@@ -300,13 +1400,146 @@ def class_values(classes, valuestops):
 
     return classvalues
 
-def breaks(items, algorithm, key=None, extrabreaks=None, exclude=None, minval=None, maxval=None, **kwargs):
+class Palette(object):
+    """
+    A precomputed lookup table from class numbers to class values, stored as a flat typed array,
+    e.g. a packed rgb or rgba color palette. Paired with the class numbers returned by `classify`,
+    this colors any number of items with a single table lookup instead of interpolating or
+    creating a class value for each item.
+
+    Attributes:
+
+    - table: Flat array.array of the class values of each class number, starting with the value of
+        class number 0 (misses), with the channels of each class value one after the other.
+    - channels: The number of channels (sequence length) of each class value, or 1 for single numbers.
+    - typecode: The array.array typecode of the table.
+    """
+
+    def __init__(self, classvalues, typecode="B", nodatavalue=None):
+        """
+        Args:
+
+        - **classvalues**: List of the class value of each class, e.g. as returned by `class_values`.
+        - **typecode** (optional): The array.array typecode of the table. Defaults to 'B' (unsigned bytes),
+            suitable for colors. Values are rounded for integer typecodes.
+        - **nodatavalue** (optional): The class value of class number 0, ie items that were outside the breaks
+            or filtered out. Defaults to 0, or a sequence of 0s for sequences of class values.
+        """
+        classvalues = list(classvalues)
+        if not classvalues:
+            raise Exception("Palette must have at least one class value")
+        sequences = hasattr(classvalues[0], "__iter__")
+        self.channels = len(classvalues[0]) if sequences else 1
+        self.typecode = typecode
+        if nodatavalue is None:
+            nodatavalue = [0] * self.channels if sequences else 0
+        entries = [nodatavalue] + classvalues
+        if not sequences:
+            entries = [[val] for val in entries]
+        if any(len(entry) != self.channels for entry in entries):
+            raise Exception("All class values and the nodata value must have the same length")
+        if typecode in "fd":
+            self.table = array(typecode, [float(val) for entry in entries for val in entry])
+        else:
+            self.table = array(typecode, [int(round(val)) for entry in entries for val in entry])
+
+    def __repr__(self):
+        return "Palette(%r classes, %r channels, typecode=%r)" % (len(self) - 1, self.channels, self.typecode)
+
+    def __len__(self):
+        return len(self.table) // self.channels
+
+    def __getitem__(self, classnum):
+        if not 0 <= classnum < len(self):
+            raise IndexError("Palette class number out of range")
+        if self.channels == 1:
+            return self.table[classnum]
+        start = classnum * self.channels
+        return tuple(self.table[start:start+self.channels])
+
+    def tobytes(self):
+        """
+        Returns the table as packed bytes, e.g. to use as the color palette of an image.
+        """
+        return self.table.tobytes() if hasattr(self.table, "tobytes") else self.table.tostring()
+
+    def apply(self, classnums):
+        """
+        Looks up the class value of each class number.
+
+        Args:
+
+        - **classnums**: Sequence of class numbers, e.g. as returned by `classify`. If it is a NumPy array,
+            the lookup is done with NumPy.
+
+        Returns:
+
+        - A flat array.array with the class value of each class number, with the channels of each class value
+            one after the other. For NumPy class numbers, a NumPy array of the same shape, with an additional last
+            dimension for the channels of sequence class values.
+        """
+        channels = self.channels
+        numpy = _vectorized.numpy
+        if numpy is not None and isinstance(classnums, numpy.ndarray):
+            table = numpy.array(self.table, dtype=numpy.dtype(self.typecode))
+            if channels > 1:
+                table = table.reshape(-1, channels)
+            return table[classnums]
+
+        if self.typecode == "B" and _buffer_format(classnums) == "B":
+            # translate the bytes of the class numbers, one channel at a time
+            if not isinstance(classnums, memoryview):
+                classnums = memoryview(classnums)
+            data = classnums.tobytes()
+            result = bytearray(len(data) * channels)
+            for channel in range(channels):
+                lookup = bytearray(256)
+                lookup[:len(self)] = bytearray(self.table[channel::channels])
+                result[channel::channels] = data.translate(bytes(lookup))
+            out = array("B")
+            if hasattr(out, "frombytes"):
+                out.frombytes(bytes(result))
+            else:
+                out.fromstring(bytes(result))
+            return out
+
+        if channels == 1:
+            table = self.table
+            return array(self.typecode, [table[classnum] for classnum in classnums])
+        entries = [self.table[start:start+channels] for start in range(0, len(self.table), channels)]
+        return array(self.typecode, itertools.chain.from_iterable(entries[classnum] for classnum in classnums))
+
+def class_palette(classes, valuestops, typecode="B", nodatavalue=None):
+    """
+    Same as `class_values`, but returns the class values as a `Palette` lookup table,
+    e.g. to color the class numbers returned by `classify`.
+
+    Example:
+
+        >>> classnums = classypie.classify(values, "natural", classes=5)
+        >>> palette = classypie.class_palette(5, [(0,255,0,255), (255,0,0,255)])
+        >>> rgba = palette.apply(classnums) # packed rgba bytes for each value
+
+    Args:
+
+    - **classes**: Number of class values to interpolate to.
+    - **valuestops**: The gradient of values to interpolate between, see `class_values`.
+    - **typecode**, **nodatavalue** (optional): See `Palette`.
+
+    Returns:
+
+    - A `Palette` of the interpolated class values.
+    """
+    return Palette(class_values(classes, valuestops), typecode, nodatavalue)
+
+def breaks(items, algorithm, key=None, extrabreaks=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False, backend=None, stream=False, **kwargs):
     """
     Given a list of items or values, classify into groups and get their break points, including the start and endpoint.
 
     Args:
 
-    - **items**: The list of items or values to classify.
+    - **items**: The list of items or values to classify. Can also be an array.array or memoryview of numbers,
+        whose values are then read directly without converting each value. 
     - **algorithm**: Name of the classification algorithm to use.
         Valid names are:
         - histogram (alias for equal)
@@ -317,7 +1550,8 @@ def breaks(items, algorithm, key=None, extrabreaks=None, exclude=None, minval=No
         - natural
         - headtail
         - log (base-10, uses offset to handle 0s but not negative numbers)
-    - **key** (optional): Function used to extract value from each item, defaults to None and treats item itself as the value.
+    - **key** (optional): Function used to extract value from each item, or the name of a field or attribute of each item.
+        Defaults to None and treats item itself as the value.
     - **extrabreaks** (optional): Force insert additional break points. These are added to the original breakpoints,
         so if the classification resulted in 5 groupings, and you insert 2 additional break values, the final classification
         will contain 7 groupings. 
@@ -325,6 +1559,20 @@ def breaks(items, algorithm, key=None, extrabreaks=None, exclude=None, minval=No
     - **exclude** (optional): A list of values defining which values to exclude.
     - **minval** (optional): Sets the lower value boundary for the classification groupings, ignoring values below this threshold.
     - **maxval** (optional): Sets the upper value boundary for the classification groupings, ignoring values above this threshold.
+    - **weights** (optional): A list of weights for each item, or a function used to extract the weight from each item.
+        Each value then counts as many times as its weight, e.g. to classify pre-aggregated (value, count) pairs
+        or to weight values by area. Items with zero or negative weights are ignored. 
+    - **presorted** (optional): If True, the items are expected to already be sorted by their values. This is checked in a
+        single pass, and the items are only sorted if they turn out not to be. 
+    - **backend** (optional): Whether to process the values as NumPy arrays ('numpy') or in pure Python ('python').
+        Defaults to 'auto' which uses NumPy whenever it is installed. 
+    - **stream** (optional): If True, reads the items only once without sorting or keeping them in memory,
+        e.g. for iterators or files larger than memory. Only supported by some algorithms:
+        - histogram/equal, log, pretty and stdev (one pass over the values)
+        - quantile (approximate, pass `error` to set the rank error, defaults to 0.01)
+        The algorithms that only need the value range or mean and standard deviation are always calculated
+        this way with the pure Python backend, unless weights are given. Streamed breaks are not
+        looked up in the breaks cache, see `cache`. 
     - **kwargs** (optional): Depending on the breaks algorithm used, any remaining kwargs are passed to the algorithm function.
         The algorithm functions and their arguments can be found in `classypie.breaks`.
 
@@ -333,53 +1581,101 @@ def breaks(items, algorithm, key=None, extrabreaks=None, exclude=None, minval=No
     - List of break points calculated for this algorithm in increasing order, i.e. the dividing lines between groupings. 
     """
 
-    # ensure values are numeric
-    def forcenumber(val):
-        try:
-            val = float(val)
-            return val
-        except:
-            return None
-    
-    # sort by key
-    if key:
-        keywrap = lambda x: forcenumber(key(x))
+    if stream or (algorithm in _single_pass and weights is None and not _use_numpy(backend)):
+        func = _stream.algorithms.get(algorithm)
+        if func is None:
+            raise Exception("The '%s' algorithm does not support streaming" % algorithm)
+        if weights is not None:
+            raise Exception("Weights are not supported when streaming")
+        prof = _instrument.current()
+        if prof: start = prof.start()
+        breaks = func(_stream_values(items, key, exclude, minval, maxval), **kwargs)
+        if prof: prof.stop("breaks", start)
+    elif _use_numpy(backend):
+        # the algorithms that only need the value range or moments do not need sorted values
+        values, weights = _vectorized.prepare_values(items, _keyfunc(key), exclude, minval, maxval, weights, presorted,
+                                                     sort=algorithm not in _single_pass)
+        breaks = _algorithm(algorithm, values, weights, numpy=True, **kwargs)
     else:
-        keywrap = forcenumber
-        
-    items = (item for item in items if keywrap(item) is not None)
-    if exclude is not None:
-        if not isinstance(exclude, (list,tuple)): exclude = [exclude]
-        items = (item for item in items if keywrap(item) not in exclude)
-    if minval is not None: items = (item for item in items if keywrap(item) >= minval)
-    if maxval is not None: items = (item for item in items if keywrap(item) <= maxval)
-    items = sorted(items, key=keywrap)
-    values = [keywrap(item) for item in items]
-
-    # get breaks
-    func = _breaks.__dict__[algorithm]
-    breaks = func(values, **kwargs)
+        items, values, weights = _prepare(items, key, exclude, minval, maxval, weights, presorted)
+        breaks = _algorithm(algorithm, values, weights, **kwargs)
 
     # insert extra breaks (list of single break values or pairs)
     if extrabreaks:
-        for val in extrabreaks:
-            oldbreaks = list(breaks)
-            
-            # insert single break value anywhere after first same or greater breakpoint
-            # (remember that duplicate breakpoints will collect only that specific value)
-            prevbrk = oldbreaks[0]
-            i = 0
-            for nextbrk in oldbreaks[1:]:
-                if prevbrk <= val < nextbrk:
-                    breaks.insert(i, val)
-                    break
-                else:
-                    prevbrk = nextbrk
-                i += 1
+        _insert_extrabreaks(breaks, extrabreaks)
     
     return breaks
 
-def split(items, breaks, key=None, exclude=None, minval=None, maxval=None, **kwargs):
+def breaks_many(items, algorithms=("equal","quantile","natural","pretty","stdev","headtail"), classes=(3,4,5,6,7,8,9), key=None, extrabreaks=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False, backend=None, **kwargs):
+    """
+    Calculates the break points of several algorithms and numbers of classes at once,
+    e.g. to compare them side by side. Much faster than calling `breaks` for each of them,
+    since the values are only extracted and sorted once, the summary statistics
+    used by several of the algorithms are calculated only once, and the exact natural breaks of
+    all the numbers of classes are found from a single table.
+
+    Args:
+
+    - **items**: The list of items or values to classify.
+    - **algorithms** (optional): List of names of the classification algorithms to use, see `breaks`.
+        Defaults to equal, quantile, natural, pretty, stdev, and headtail.
+    - **classes** (optional): List of the numbers of classes to calculate breaks for. Defaults to 3 to 9.
+    - **key**, **extrabreaks**, **exclude**, **minval**, **maxval**, **weights**, **presorted**, **backend** (optional):
+        Same as for `breaks`. 
+    - **kwargs** (optional): Options for specific algorithms, given as a dictionary of kwargs for each algorithm name,
+        e.g. natural=dict(maxsize=1000). 
+
+    Returns:
+
+    - Dictionary of the list of break points for each (algorithm, classes) pair. 
+    """
+    for name in kwargs:
+        if name not in algorithms:
+            raise Exception("Options were given for '%s' which is not one of the algorithms" % name)
+
+    numpy = _use_numpy(backend)
+    if numpy:
+        values, weights = _vectorized.prepare_values(items, _keyfunc(key), exclude, minval, maxval, weights, presorted,
+                                                     sort=any(algorithm not in _single_pass for algorithm in algorithms))
+    else:
+        items, values, weights = _prepare(items, key, exclude, minval, maxval, weights, presorted)
+    n = len(values)
+
+    results = dict()
+    acc = None
+    for algorithm in algorithms:
+        options = kwargs.get(algorithm, {})
+        todo = list(classes)
+
+        if algorithm == "natural" and not (options.get("maxsize") and n > options["maxsize"]):
+            # all numbers of classes from a single table
+            many = [k for k in todo if n > k]
+            if many:
+                jenks = _vectorized._jenks_many if numpy else _breaks._jenks_many
+                for k,breaks in jenks(values, many, weights).items():
+                    results[(algorithm, k)] = breaks
+                todo = [k for k in todo if k not in many]
+
+        elif algorithm in _single_pass and weights is None and not numpy:
+            # value range, mean and standard deviation from a single pass
+            if acc is None:
+                acc = _stream.Accumulator(values)
+            for k in todo:
+                if algorithm != "stdev" or n > k:
+                    results[(algorithm, k)] = _stream.algorithms[algorithm](acc, classes=k, **options)
+            todo = [k for k in todo if (algorithm, k) not in results]
+
+        for k in todo:
+            results[(algorithm, k)] = _algorithm(algorithm, values, weights, numpy=numpy, classes=k, **options)
+
+    # insert extra breaks (list of single break values or pairs)
+    if extrabreaks:
+        for breaks in results.values():
+            _insert_extrabreaks(breaks, extrabreaks)
+
+    return results
+
+def split(items, breaks, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False, backend=None, **kwargs):
     """
     Splits a list of items into n non-overlapping classes based on the
     specified algorithm. Values are either the items themselves or
@@ -387,7 +1683,8 @@ def split(items, breaks, key=None, exclude=None, minval=None, maxval=None, **kwa
 
     Args:
 
-    - **items**: The list of items or values to classify.
+    - **items**: The list of items or values to classify. Can also be an array.array or memoryview of numbers,
+        whose values are then read directly without converting each value. 
     - **breaks**: List of custom break values, or the name of the algorithm to use.
         Valid names are:
         - histogram (alias for equal)
@@ -398,7 +1695,8 @@ def split(items, breaks, key=None, exclude=None, minval=None, maxval=None, **kwa
         - natural
         - headtail
         - log (base-10, uses offset to handle 0s but not negative numbers)
-    - **key** (optional): Function used to extract value from each item, defaults to None and treats item itself as the value.
+    - **key** (optional): Function used to extract value from each item, or the name of a field or attribute of each item.
+        Defaults to None and treats item itself as the value.
     - **extrabreaks** (optional): Force insert additional break points. These are added to the original breakpoints,
         so if the classification resulted in 5 groupings, and you insert 2 additional break values, the final classification
         will contain 7 groupings. 
@@ -406,222 +1704,596 @@ def split(items, breaks, key=None, exclude=None, minval=None, maxval=None, **kwa
     - **exclude** (optional): A list of values defining which values to exclude.
     - **minval** (optional): Sets the lower value boundary for the classification groupings, ignoring values below this threshold.
     - **maxval** (optional): Sets the upper value boundary for the classification groupings, ignoring values above this threshold.
+    - **weights** (optional): A list of weights for each item, or a function used to extract the weight from each item.
+        Each value then counts as many times as its weight, e.g. to classify pre-aggregated (value, count) pairs
+        or to weight values by area. Items with zero or negative weights are ignored. 
+    - **presorted** (optional): If True, the items are expected to already be sorted by their values. This is checked in a
+        single pass, and the items are only sorted if they turn out not to be. 
+    - **backend** (optional): Whether to process the values as NumPy arrays ('numpy') or in pure Python ('python').
+        Defaults to 'auto' which uses NumPy whenever it is installed. 
     - **kwargs** (optional): Depending on the breaks algorithm used, any remaining kwargs are passed to the algorithm function.
         The algorithm functions and their arguments can be found in `classypie.breaks`.
 
     Returns:
 
     - Iterates over the range groupings, each time yielding a 2-tuple of the group (its min-max value range) and a list of the
-        items belonging to that group. 
+        items belonging to that group. For an array.array or memoryview of numbers, the members of each group are
+        instead an array.array with the same typecode, on both backends. 
     """
+    for classnum,valrange,members in _split(items, breaks, key=key, exclude=exclude, minval=minval, maxval=maxval, weights=weights, presorted=presorted, backend=backend, **kwargs):
+        yield valrange, members
+
+def _split(items, breaks, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False, backend=None, **kwargs):
+    # same as split, but also yields the class number of each group
+    usenumpy = _use_numpy(backend)
+    if usenumpy:
+        items, values, weights = _vectorized.prepare(items, _keyfunc(key), exclude, minval, maxval, weights, presorted)
+    else:
+        items, values, weights = _prepare(items, key, exclude, minval, maxval, weights, presorted)
 
-    # ensure values are numeric
-    def forcenumber(val):
-        try:
-            val = float(val)
-            return val
-        except:
-            return None
+    # if not custom specified, get break values from algorithm name
+    if isinstance(breaks, str):
+        breaks = _algorithm(breaks, values, weights, numpy=usenumpy, **kwargs)
 
-    # sort and get key
-    if key:
-        keywrap = lambda x: forcenumber(key(x))
+    # assign classes with a compiled index
+    if isinstance(breaks, BreakIndex):
+        index = breaks
     else:
-        keywrap = forcenumber
-        
-    items = (item for item in items if keywrap(item) is not None)
-    if exclude is not None:
-        if not isinstance(exclude, (list,tuple)): exclude = [exclude]
-        items = (item for item in items if keywrap(item) not in exclude)
-    if minval is not None: items = (item for item in items if keywrap(item) >= minval)
-    if maxval is not None: items = (item for item in items if keywrap(item) <= maxval)
-    items = sorted(items, key=keywrap)
-    values = [keywrap(item) for item in items]
+        # custom specified breakpoints
+        index = BreakIndex(list(breaks))
+
+    for classnum,start,end in _classify_sorted(values, index, usenumpy):
+        yield classnum, index.range(classnum), items[start:end]
+
+def split_compact(items, breaks, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False, backend=None, **kwargs):
+    """
+    Same as `split`, but returns the groupings in a compact form instead of a list of items for each class, 
+    which saves a lot of memory for large numbers of items. The items are only referenced once, 
+    while each class is a range of a single array of item indexes that have been sorted
+    by class and value. 
+
+    Args:
+
+    - **items**: The list of items or values to classify.
+    - **breaks**: List of custom break values, or the name of the algorithm to use.
+    - **key**, **exclude**, **minval**, **maxval**, **weights**, **presorted**, **backend**, and **kwargs** (optional):
+        Same as for `split`. 
+
+    Returns:
+
+    - A `CompactSplit` of the items, which can be iterated the same way as `split`. 
+    """
+    usenumpy = _use_numpy(backend)
+    if usenumpy:
+        items, order, values, weights = _vectorized.argprepare(items, _keyfunc(key), exclude, minval, maxval, weights, presorted)
+    else:
+        items, order, values, weights = _argprepare(items, key, exclude, minval, maxval, weights, presorted)
 
     # if not custom specified, get break values from algorithm name
     if isinstance(breaks, str):
-        func = _breaks.__dict__[breaks]
-        breaks = func(values, **kwargs)
+        breaks = _algorithm(breaks, values, weights, numpy=usenumpy, **kwargs)
+
+    # assign classes with a compiled index
+    if isinstance(breaks, BreakIndex):
+        index = breaks
     else:
         # custom specified breakpoints
-        breaks = list(breaks)
+        index = BreakIndex(list(breaks))
+
+    # collect the sorted ranges of each class
+    classranges = [[] for _ in range(len(index))]
+    for classnum,start,end in _classify_sorted(values, index, usenumpy):
+        classranges[classnum-1].append((start, end))
+
+    offsets = array('l', [0])
+    if usenumpy:
+        slices = [order[start:end] for ranges in classranges for start,end in ranges]
+        for ranges in classranges:
+            offsets.append(offsets[-1] + sum(end - start for start,end in ranges))
+        indexes = _vectorized.numpy.concatenate(slices) if slices else order[:0]
+    else:
+        indexes = array('l')
+        for ranges in classranges:
+            for start,end in ranges:
+                indexes.extend(order[start:end])
+            offsets.append(len(indexes))
 
-    breaks_gen = (brk for brk in breaks)
-    loopdict = dict()
-    loopdict["prevbrk"] = next(breaks_gen)
-    loopdict["nextbrk"] = next(breaks_gen)
+    return CompactSplit(items, indexes, offsets, index)
 
-    def find_class(item, loopdict=loopdict):
-        val = keywrap(item)
-        
-##        while eval(str(val)) > eval(str(loopdict["nextbrk"])):
-##            loopdict["prevbrk"] = loopdict["nextbrk"]
-##            loopdict["nextbrk"] = next(breaks_gen)
-##        if eval(str(loopdict["prevbrk"])) <= eval(str(val)) <= eval(str(loopdict["nextbrk"])):
-##            return loopdict["prevbrk"],loopdict["nextbrk"]
-        
-##        if eval(str(val)) < loopdict["prevbrk"]:
-##            # value lower than first class
-##            return None
-##        else:
-##            while not (eval(str(loopdict["prevbrk"])) <= eval(str(val)) <= eval(str(loopdict["nextbrk"]))):
-##                print eval(str(loopdict["prevbrk"])) , eval(str(val)) , eval(str(loopdict["nextbrk"]))
-##                # increment breaks until value is between
-##                loopdict["prevbrk"] = loopdict["nextbrk"]
-##                loopdict["nextbrk"] = next(breaks_gen, None)
-##                if loopdict["nextbrk"] == None:
-##                    return None
-##            # supposedly in between, so test and return class range
-##            if eval(str(loopdict["prevbrk"])) <= eval(str(val)) < eval(str(loopdict["nextbrk"])):
-##                return loopdict["prevbrk"],loopdict["nextbrk"]
-
-        prevbrk = breaks[0]
-        for i,nextbrk in enumerate(breaks[1:]):
-            ###print val,i+1,len(breaks)-1
-            if eval(str(val)) < eval(str(prevbrk)):
-                return None
-            elif eval(str(prevbrk)) <= eval(str(val)) < eval(str(nextbrk)):
-                return prevbrk,nextbrk
-            elif eval(str(prevbrk)) == eval(str(val)) == eval(str(nextbrk)):
-                return prevbrk,nextbrk
-            elif i+1==len(breaks)-1 and eval(str(val)) <= eval(str(nextbrk)):
-                return prevbrk,nextbrk
-            prevbrk = nextbrk
+class CompactSplit(object):
+    """
+    The result of `split_compact`, where the members of each class are a range of a single
+    array of item indexes. The members of each class can be accessed as lazy views without
+    copying any items. Iterating yields a 2-tuple of the value range and members of each class
+    that has any members, the same as `split`. 
+
+    Attributes:
+
+    - items: The list of all the items, including those that were filtered out. 
+    - indexes: Array of the indexes of the classified items, sorted by class and then value. 
+        An array('l'), or a NumPy integer array with the NumPy backend. 
+    - offsets: array('l') of where each class starts in indexes, with an additional final entry,
+        so that the members of class number c (1 as the first class) are at offsets[c-1] to offsets[c]. 
+    - breaks: The list of break points that define the class groupings. 
+    """
+
+    def __init__(self, items, indexes, offsets, index):
+        self.items = items
+        self.indexes = indexes
+        self.offsets = offsets
+        self.breaks = index.breaks
+        self._index = index
+
+    def __repr__(self):
+        return "CompactSplit(breaks=%r, counts=%r)" % (self.breaks, self.counts())
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for classnum in range(1, len(self.offsets)):
+            if self.offsets[classnum] > self.offsets[classnum-1]:
+                yield self.range(classnum), self.members(classnum)
+
+    def range(self, classnum):
+        """
+        Returns the lower and upper breakpoint values of a class number (1 as the first class). 
+        """
+        return self._index.range(classnum)
+
+    def members(self, classnum):
+        """
+        Returns a lazy view of the items that belong to a class number (1 as the first class). 
+        """
+        return ClassMembers(self.items, self.indexes, self.offsets[classnum-1], self.offsets[classnum])
+
+    def counts(self):
+        """
+        Returns a list of the number of items in each class. 
+        """
+        return [self.offsets[i+1] - self.offsets[i] for i in range(len(self.offsets) - 1)]
+
+class ClassMembers(object):
+    """
+    A lazy, read-only view of the items of one class in a `CompactSplit`,
+    supporting len, iteration and indexing like a list. 
+    """
+
+    def __init__(self, items, indexes, start, end):
+        self._items = items
+        self._indexes = indexes
+        self._start = start
+        self._end = end
+
+    def __repr__(self):
+        return "ClassMembers(%r items)" % len(self)
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __iter__(self):
+        items = self._items
+        for i in range(self._start, self._end):
+            yield items[self._indexes[i]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start,end,step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, end, step)]
+            return ClassMembers(self._items, self._indexes, self._start + start, self._start + max(start, end))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ClassMembers index out of range")
+        return self._items[self._indexes[self._start + i]]
+
+    @property
+    def indexes(self):
+        """
+        The indexes of the items in this class, as a slice of the split indexes. 
+        """
+        return self._indexes[self._start:self._end]
+
+def classify(items, breaks, key=None, exclude=None, minval=None, maxval=None, weights=None, backend=None, typecode=None, palette=None, **kwargs):
+    """
+    Finds the class number of every item, in the original order of the items. 
+    Returns a compact typed array instead of grouping the items, e.g. for
+    writing to a file or raster. 
+
+    Args:
+
+    - **items**: The list of items or values to classify, which can also be an array.array or
+        memoryview of numbers, whose values are then read directly. 
+    - **breaks**: List of custom break values, or the name of the algorithm to use.
+    - **key**, **exclude**, **minval**, **maxval**, **weights**, **backend**, and **kwargs** (optional):
+        Same as for `split`. Weights only affect the calculation of the breaks. 
+    - **typecode** (optional): The array.array typecode of the class numbers. Defaults to the smallest
+        unsigned integer type that fits the number of classes. 
+    - **palette** (optional): A `Palette` to look up the class value of each item, see `class_palette`. 
+
+    Returns:
+
+    - An array.array of the class number of each item (1 as the first class), with 0 for items that
+        are outside the breaks or were filtered out. If a palette is given, returns the flat array.array
+        of the class values of each item instead, see `Palette.apply`. 
+    """
+    if _buffer_format(items) is None and not isinstance(items, (list, tuple)):
+        if not (_use_numpy(backend) and isinstance(items, _vectorized.numpy.ndarray)):
+            items = list(items)
+
+    # if not custom specified, get break values from algorithm name
+    usenumpy = _use_numpy(backend)
+    if isinstance(breaks, str):
+        if usenumpy:
+            values, sortedweights = _vectorized.prepare_values(items, _keyfunc(key), exclude, minval, maxval, weights,
+                                                               sort=breaks not in _single_pass)
         else:
-            return None
+            _, values, sortedweights = _prepare(items, key, exclude, minval, maxval, weights)
+        breaks = _algorithm(breaks, values, sortedweights, numpy=usenumpy, **kwargs)
+    if isinstance(breaks, BreakIndex):
+        index = breaks
+    else:
+        index = BreakIndex(list(breaks))
+
+    if typecode is None:
+        typecode = "B" if len(index) < 2**8 else "H" if len(index) < 2**16 else "L"
+
+    if usenumpy:
+        items, values = _vectorized.extract(items, _keyfunc(key))
+        mask = _vectorized.filtermask(values, exclude, minval, maxval)
+        if index.ordered:
+            classnums = _vectorized.classify(values, index.breaks)
+        else:
+            classnums = _vectorized.numpy.array([classnum or 0 for classnum in index.classify_many(values.tolist())])
+        classnums[~mask] = 0
+        result = array(typecode)
+        data = classnums.astype(_vectorized.numpy.dtype(typecode)).tobytes()
+        if hasattr(result, "frombytes"):
+            result.frombytes(data)
+        else:
+            result.fromstring(data)
+        return palette.apply(result) if palette is not None else result
 
-    for valrange,members in itertools.groupby(items, key=find_class):
-        if valrange is not None:
-            yield valrange, list(members)
+    classify = index.classify
+    if key is None and _buffer_format(items) is not None and exclude is None and minval is None and maxval is None:
+        # read numbers directly
+        result = array(typecode, [classify(val) or 0 for val in items])
+    else:
+        result = array(typecode, [0]) * len(items)
+        for (pos,item),val,weight in _values(enumerate(items), _poskey(key), exclude, minval, maxval):
+            result[pos] = classify(val) or 0
+    return palette.apply(result) if palette is not None else result
+
+def _unique_filter(items, key, only, exclude):
+    # pairs of each item and its unique value, skipping items that are filtered out
+    # only and exclude are checked against sets
+    key = _keyfunc(key)
+    pairs = ((key(item),item) for item in items) if key else ((item,item) for item in items)
+    if only:
+        only = set(only)
+        pairs = ((uid,item) for uid,item in pairs if uid in only)
+    elif exclude:
+        exclude = set(exclude)
+        pairs = ((uid,item) for uid,item in pairs if uid not in exclude)
+    return pairs
+
+def _unique_order(uids, order):
+    # the unique values in first-seen or sorted order
+    if order == "first":
+        return uids
+    elif order == "sorted":
+        try:
+            return sorted(uids)
+        except TypeError:
+            # values of mixed types that cannot be compared keep their first-seen order
+            return uids
+    else:
+        raise Exception("Unknown order '%s', must be 'sorted' or 'first'" % order)
 
-def unique(items, key=None, only=None, exclude=None):
+def unique(items, key=None, only=None, exclude=None, order="sorted"):
     """
     Bins all same values together, so all bins are unique.
-    Only for ints or text values.
+    Only for ints or text values, or any other hashable values. 
+
+    The items are grouped with a dictionary in a single pass, and only the unique values are sorted. 
 
     Args:
 
     - **items**: The list of items or values to classify.
-    - **key** (optional): Function used to extract value from each item, defaults to None and treats item itself as the value.
+    - **key** (optional): Function used to extract value from each item, or the name of a field or attribute of each item.
+        Defaults to None and treats item itself as the value.
     - **only** (optional): A list of values defining which values to include. 
     - **exclude** (optional): A list of values defining which values to exclude. Does not apply if `only` is already specified.
+    - **order** (optional): The order of the unique values, either 'sorted' (default) or 'first' for the order
+        in which they first appear. Values of mixed types that cannot be sorted keep their first-seen order. 
+
+    Returns:
+
+    - Iterates over the unique values, each time yielding a 2-tuple of the unique value and a list of the items
+        with that value, in their original order. 
     """
-    
-    # sort and get key
-    if key:
-        pass
-    else:
-        key = lambda x: x
+    groups = dict()
+    uids = []
+    for uid,item in _unique_filter(items, key, only, exclude):
+        members = groups.get(uid)
+        if members is None:
+            members = groups[uid] = []
+            uids.append(uid)
+        members.append(item)
+
+    for uid in _unique_order(uids, order):
+        yield uid, groups[uid]
+
+def unique_counts(items, key=None, only=None, exclude=None, order="sorted"):
+    """
+    Same as `unique`, but only counts the number of items with each unique value,
+    without keeping the items. 
 
-    if only:
-        items = (item for item in items if key(item) in only)
-    elif exclude:
-        items = (item for item in items if key(item) not in exclude)
+    Returns:
+
+    - A list of 2-tuples of each unique value and the number of items with that value. 
+    """
+    counts = dict()
+    uids = []
+    for uid,item in _unique_filter(items, key, only, exclude):
+        count = counts.get(uid)
+        if count is None:
+            uids.append(uid)
+            counts[uid] = 1
+        else:
+            counts[uid] = count + 1
+    return [(uid, counts[uid]) for uid in _unique_order(uids, order)]
 
-    items = sorted(items, key=key)
+def unique_codes(items, key=None, only=None, exclude=None, order="sorted", typecode=None):
+    """
+    Same as `unique`, but returns the unique values dictionary-encoded, as a table of
+    the unique values (categories) and a compact typed array of the category code of each item,
+    in the original order of the items. 
 
-    for uniq,members in itertools.groupby(items, key=key):
-        yield uniq, list(members)
+    Args:
 
-    # maybe add remaining groups if none?
-    # ... 
+    - **items**, **key**, **only**, **exclude**, **order** (optional): See `unique`. 
+    - **typecode** (optional): The array.array typecode of the codes. Defaults to the smallest
+        unsigned integer type that fits the number of unique values. 
 
-def membership(items, ranges, key=None):
+    Returns:
+
+    - A 2-tuple of the array.array of the code of each item, and the list of unique values. 
+        The code of an item is the position of its value in the list of unique values,
+        starting at 1 for the first, with 0 for items that were filtered out. 
+    """
+    key = _keyfunc(key)
+    if only:
+        only = set(only)
+        exclude = None
+    elif exclude:
+        exclude = set(exclude)
+    else:
+        exclude = None
+    codes = dict()
+    uids = []
+    itemcodes = []
+    for item in items:
+        uid = key(item) if key else item
+        if (only and uid not in only) or (exclude is not None and uid in exclude):
+            itemcodes.append(0)
+            continue
+        code = codes.get(uid)
+        if code is None:
+            uids.append(uid)
+            code = codes[uid] = len(uids)
+        itemcodes.append(code)
+
+    categories = _unique_order(uids, order)
+    if categories is not uids:
+        # renumber the first-seen codes
+        lookup = [0] * (len(uids) + 1)
+        for newcode,uid in enumerate(categories, 1):
+            lookup[codes[uid]] = newcode
+        itemcodes = [lookup[code] for code in itemcodes]
+
+    if typecode is None:
+        typecode = "B" if len(categories) < 2**8 else "H" if len(categories) < 2**16 else "L"
+    return array(typecode, itemcodes), categories
+
+def membership(items, ranges, key=None, stream=False):
     """
     Groups can be overlapping/nonexclusive and are based on custom ranges.
     This means that each item or value can be part of multiple group ranges. 
 
+    The key is evaluated only once for each item. The values are then sorted once,
+    and the members of each range are found with two binary searches. 
+
     Args:
 
     - **items**: The list of items or values to classify.
     - **ranges**: A list of min-max tuples defining the upper and lower bounds of each group membership.
-    - **key** (optional): Function used to extract value from each item, defaults to None and treats item itself as the value.
+    - **key** (optional): Function used to extract value from each item, or the name of a field or attribute of each item.
+        Defaults to None and treats item itself as the value.
+    - **stream** (optional): If True, iterates over the items one at a time instead of the ranges, using
+        a `RangeIndex` to find the ranges of each item. This way items can be any iterable
+        or stream of items, which is read lazily in a single pass. 
 
     Returns:
 
     - Iterates over the range groupings, each time yielding a 2-tuple of the group (its min-max value range) and a list of the
-        items belonging to that group. 
+        items belonging to that group, in their original order. 
+    - If stream is True, instead iterates over the items, each time yielding a 2-tuple of the item and a list of the
+        min-max ranges it belongs to. 
     """
-    ###
-    if not key:
-        key = lambda x: x
-    ###
+    key = _keyfunc(key)
+    if stream:
+        index = ranges if isinstance(ranges, RangeIndex) else RangeIndex(ranges)
+        for item in items:
+            yield item, index.find(key(item) if key else item)
+        return
+
+    items = list(items)
+    values = [key(item) for item in items] if key else items
+    order = sorted(range(len(values)), key=values.__getitem__)
+    sortedvals = [values[i] for i in order]
     for _min,_max in ranges:
-        valitems = ((key(item),item) for item in items)
-        members = [item for val,item in valitems if val >= _min and val <= _max]
+        start = bisect.bisect_left(sortedvals, _min)
+        end = bisect.bisect_right(sortedvals, _max)
+        members = [items[i] for i in sorted(order[start:end])]
         yield (_min,_max), members
 
-def rescale(items, newmin, newmax, key=None, only=None, exclude=None):
+def rescale(items, newmin, newmax, key=None, only=None, exclude=None, backend=None, oldmin=None, oldmax=None, stats=None):
     """
     Iterates over all items, along with a new value for each.
     The new value is the item value rescaled to range from newmin to newmax.
 
+    By default all the items are read first to find the lowest and highest item values.
+    If these are known in advance, e.g. from a `stream.Accumulator` of a live stream, they can be
+    given with oldmin and oldmax or stats. The items are then rescaled lazily one at a time in a
+    single pass, so that any iterable or endless stream of items can be rescaled with constant memory.
+
     Args:
 
     - **items**: The list of items or values to rescale.
     - **newmin**: The new minimum which the lowest item value will be rescaled to.
     - **newmax**: The new maximum which the highest item value will be rescaled to.
-    - **key** (optional): Function used to extract value from each item, defaults to None and treats item itself as the value.
+    - **key** (optional): Function used to extract value from each item, or the name of a field or attribute of each item.
+        Defaults to None and treats item itself as the value.
     - **only** (optional): A list of values defining which values to include. 
     - **exclude** (optional): A list of values defining which values to exclude. Does not apply if `only` is already specified.
+    - **backend** (optional): Whether to process the values as NumPy arrays ('numpy') or in pure Python ('python').
+        Defaults to 'auto' which uses NumPy whenever it is installed. Not used when both oldmin and oldmax are known.
+    - **oldmin** (optional): The value to rescale to newmin, instead of the lowest item value. 
+    - **oldmax** (optional): The value to rescale to newmax, instead of the highest item value. 
+    - **stats** (optional): An object with min and max attributes to use for oldmin and oldmax if they are not given,
+        e.g. a `stream.Accumulator` or `stream.QuantileSketch`.
 
     Returns:
 
     - Iterates over the input items, each time yielding a tuple of the original item along with the new rescaled value. 
     """
-    # ensure values are numeric
-    def forcenumber(val):
-        try:
-            val = float(val)
-            return val
-        except:
-            return None
+    if stats is not None:
+        if oldmin is None: oldmin = stats.min
+        if oldmax is None: oldmax = stats.max
+
+    if oldmin is not None and oldmax is not None:
+        # stream in a single pass
+        newval = _rescaler(oldmin, oldmax, newmin, newmax)
+        for item,val,weight in _values(items, key, exclude=None if only else (exclude or None), only=only or None):
+            yield item, newval(val)
+        return
+
+    if _use_numpy(backend):
+        items, values = _vectorized.extract(items, _keyfunc(key))
+        if only:
+            mask = _vectorized.filtermask(values, only=only)
+        elif exclude:
+            mask = _vectorized.filtermask(values, exclude=exclude)
+        else:
+            mask = _vectorized.filtermask(values)
+        indexes = _vectorized.numpy.flatnonzero(mask)
+        items, values = _vectorized.take(items, indexes), values[indexes]
+
+        if oldmin is None: oldmin = values.min()
+        if oldmax is None: oldmax = values.max()
+        if oldmin == oldmax:
+            # special case, only one value, return max newval
+            newvals = [newmax] * len(values)
+        elif hasattr(newmin, "__iter__") and hasattr(newmax, "__iter__"):
+            # tuples of eg colors
+            if len(newmin) != len(newmax):
+                raise Exception("If newmin/newmax are sequences they must both have the same length")
+            newvals = zip(*[arr.tolist() for arr in _vectorized.rescale(values, oldmin, oldmax, newmin, newmax)])
+            newvals = (list(nv) for nv in newvals)
+        else:
+            newvals = _vectorized.rescale(values, oldmin, oldmax, newmin, newmax).tolist()
 
-    # sort and get key
-    if key:
-        keywrap = lambda x: forcenumber(key(x))
-    else:
-        keywrap = forcenumber
+        for item,nv in zip(items, newvals):
+            yield item, nv
+        return
 
-    pairs = ((item,keywrap(item)) for item in items)
-    pairs = ((item,val) for item,val in pairs if val is not None)
+    items, values, _ = _extract(items, key, exclude=None if only else (exclude or None), only=only or None)
+    if not values:
+        raise ValueError("Cannot rescale an empty sequence of values")
 
-    if only:
-        pairs = ((item,val) for item,val in pairs if val in only)
-    elif exclude:
-        pairs = ((item,val) for item,val in pairs if val not in exclude)
+    if oldmin is None: oldmin = min(values)
+    if oldmax is None: oldmax = max(values)
 
-    items,values = zip(*pairs)
+    newval = _rescaler(oldmin, oldmax, newmin, newmax)
 
-    oldmin, oldmax = min(values), max(values)
+    for item,val in zip(items, values):
+        nv = newval(val)
+        yield item, nv
 
-    def _lerp(val, oldfrom, oldto, newfrom, newto):
-        oldrange = oldto - oldfrom
-        relval = (val - oldfrom) / float(oldrange)
-        newrange = newto - newfrom
-        newval = newfrom + newrange * relval
-        return newval
+def rescale_array(values, newmin, newmax, oldmin=None, oldmax=None, stats=None, typecode="d", backend=None):
+    """
+    Rescales a whole sequence of numbers at once to range from newmin to newmax, returning a
+    compact typed array instead of iterating over each item, e.g. for sizing or coloring
+    all the values of an array.array or memoryview in one call.
 
-    # determine appropriate interp func for either sequenes or single values
+    Args:
 
-    if oldmin == oldmax:
-        # special case, only one value, return max newval
-        def newval(val):
-            return newmax
-    elif hasattr(newmin, "__iter__") and hasattr(newmax, "__iter__"):
-        # tuples of eg colors
-        if len(newmin) != len(newmax):
-            raise Exception("If newmin/newmax are sequences they must both have the same length")
-        def newval(val):
-            return [_lerp(val, oldmin, oldmax, ifromval, itoval)
-                        for ifromval,itoval in zip(newmin,newmax)]
-    else:
-        def newval(val):
-            return _lerp(val, oldmin, oldmax, newmin, newmax)
+    - **values**: An array.array, memoryview, NumPy array or sequence of numbers.
+    - **newmin**, **newmax**: The new minimum and maximum, which can also be sequences of numbers
+        such as rgb colors, see `rescale`.
+    - **oldmin**, **oldmax**, **stats** (optional): The values to rescale to newmin and newmax, see `rescale`.
+        Defaults to the lowest and highest of the values.
+    - **typecode** (optional): The array.array typecode of the result. Defaults to 'd' (floats).
+        Values are rounded for integer typecodes, e.g. 'B' for colors.
+    - **backend** (optional): Whether to process the values as NumPy arrays ('numpy') or in pure Python ('python').
+        Defaults to 'auto' which uses NumPy whenever it is installed. 
 
-    for item,val in zip(items, values):
-        nv = newval(val)
-        yield item, nv
+    Returns:
+
+    - An array.array of the rescaled values. Sequences of newmin/newmax are returned with the numbers
+        of each rescaled value one after the other, like `Palette.apply`. 
+    """
+    if stats is not None:
+        if oldmin is None: oldmin = stats.min
+        if oldmax is None: oldmax = stats.max
+    sequences = hasattr(newmin, "__iter__") and hasattr(newmax, "__iter__")
+    if sequences and len(newmin) != len(newmax):
+        raise Exception("If newmin/newmax are sequences they must both have the same length")
+    integer = typecode not in "fd"
+
+    if _use_numpy(backend):
+        numpy = _vectorized.numpy
+        if _buffer_format(values) is not None:
+            values = numpy.frombuffer(values, dtype=numpy.dtype(_buffer_format(values))).astype(float)
+        else:
+            values = numpy.asarray(values, dtype=float).ravel()
+        if not len(values):
+            return array(typecode)
+        if oldmin is None: oldmin = values.min()
+        if oldmax is None: oldmax = values.max()
+        if oldmin == oldmax:
+            # special case, only one value, return max newval
+            newvals = numpy.tile(numpy.asarray(newmax, dtype=float), len(values))
+        elif sequences:
+            newvals = numpy.column_stack(_vectorized.rescale(values, oldmin, oldmax, newmin, newmax)).ravel()
+        else:
+            newvals = _vectorized.rescale(values, oldmin, oldmax, newmin, newmax)
+        if integer:
+            newvals = numpy.round(newvals)
+        result = array(typecode)
+        data = newvals.astype(numpy.dtype(typecode)).tobytes()
+        if hasattr(result, "frombytes"):
+            result.frombytes(data)
+        else:
+            result.fromstring(data)
+        return result
+
+    if _buffer_format(values) is None:
+        values = [float(val) for val in values]
+    if not len(values):
+        return array(typecode)
+    if oldmin is None: oldmin = min(values)
+    if oldmax is None: oldmax = max(values)
+    newval = _rescaler(oldmin, oldmax, newmin, newmax)
+    if sequences:
+        newvals = itertools.chain.from_iterable(newval(val) for val in values)
+    else:
+        newvals = (newval(val) for val in values)
+    if integer:
+        newvals = (int(round(val)) for val in newvals)
+    return array(typecode, newvals)
     
     
 
@@ -0,0 +1,263 @@
+"""
+Classification of raw binary files of numbers that are too large to fit in memory,
+e.g. raster bands or sensor logs. The files are memory-mapped and read in chunks,
+so that memory use stays the same regardless of the file size.
+"""
+
+from __future__ import division
+from . import main as _main
+from .breaks import natural as _natural
+from . import stream as _stream
+from . import vectorized as _vectorized
+import os
+import mmap
+from array import array
+
+
+
+# Reading
+
+def _count(path, dtype, offset):
+    # number of values in the file after the offset
+    itemsize = array(dtype).itemsize
+    size = os.path.getsize(path) - offset
+    return max(0, size // itemsize)
+
+def _rawchunks(path, dtype="d", offset=0, chunksize=2**20, byteswap=False, usenumpy=False):
+    # iterates over all the values of the file in chunks, as float NumPy arrays or array.arrays
+    itemsize = array(dtype).itemsize
+    count = _count(path, dtype, offset)
+    if count == 0:
+        return
+    with open(path, "rb") as fobj:
+        mm = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start in range(0, count, chunksize):
+                end = min(count, start + chunksize)
+                if usenumpy:
+                    numpy = _vectorized.numpy
+                    chunkdtype = numpy.dtype(dtype)
+                    if byteswap:
+                        chunkdtype = chunkdtype.newbyteorder()
+                    # copy so that no views of the memory map are left when it is closed
+                    view = numpy.frombuffer(mm, dtype=chunkdtype, count=end-start, offset=offset+start*itemsize)
+                    chunk = view.astype(float)
+                    del view
+                    yield chunk
+                else:
+                    chunk = array(dtype)
+                    data = mm[offset+start*itemsize:offset+end*itemsize]
+                    if hasattr(chunk, "frombytes"):
+                        chunk.frombytes(data)
+                    else:
+                        chunk.fromstring(data)
+                    if byteswap:
+                        chunk.byteswap()
+                    yield chunk
+        finally:
+            mm.close()
+
+def _chunks(path, dtype="d", offset=0, nodata=None, chunksize=2**20, byteswap=False, usenumpy=False):
+    # iterates over the valid values of the file in chunks, as NumPy arrays or lists
+    for chunk in _rawchunks(path, dtype, offset, chunksize, byteswap, usenumpy):
+        # skip nodata and nan values
+        if usenumpy:
+            mask = ~_vectorized.numpy.isnan(chunk)
+            if nodata is not None:
+                mask &= chunk != nodata
+            yield chunk[mask]
+        elif nodata is not None:
+            yield [val for val in chunk if val == val and val != nodata]
+        else:
+            yield [val for val in chunk if val == val]
+
+def read_chunks(path, dtype="d", offset=0, nodata=None, chunksize=2**20, byteswap=False, backend=None):
+    """
+    Memory-maps a raw binary file of numbers and iterates over its values in chunks,
+    leaving out nodata and NaN values.
+
+    Args:
+
+    - **path**: Path to the binary file.
+    - **dtype** (optional): The array.array typecode of the numbers in the file, e.g. 'f' for 32-bit floats
+        or 'd' for 64-bit floats (default).
+    - **offset** (optional): Number of header bytes to skip at the start of the file.
+    - **nodata** (optional): Value that marks missing data, which is left out.
+    - **chunksize** (optional): Number of values to read at a time.
+    - **byteswap** (optional): If True, the numbers are stored with the opposite byte order of this machine.
+    - **backend** (optional): Whether to return the chunks as NumPy arrays ('numpy') or lists ('python').
+        Defaults to 'auto' which uses NumPy whenever it is installed.
+
+    Returns:
+
+    - Iterates over the valid values in chunks.
+    """
+    return _chunks(path, dtype, offset, nodata, chunksize, byteswap, _main._use_numpy(backend))
+
+
+
+# Summaries
+
+def _summarize(chunks, usenumpy):
+    # exact summary statistics, one chunk at a time
+    acc = _stream.Accumulator()
+    for chunk in chunks:
+        if usenumpy:
+            if not len(chunk):
+                continue
+            chunkacc = _stream.Accumulator()
+            chunkacc.n = len(chunk)
+            chunkacc.min = float(chunk.min())
+            chunkacc.max = float(chunk.max())
+            chunkacc.mean = float(chunk.mean())
+            chunkacc._m2 = float(((chunk - chunkacc.mean) ** 2).sum())
+            acc.merge(chunkacc)
+        else:
+            acc.extend(chunk)
+    return acc
+
+def _above(chunks, threshold, usenumpy):
+    # number and sum of the values greater than or equal to a threshold
+    count = 0
+    total = 0.0
+    for chunk in chunks:
+        if usenumpy:
+            head = chunk[chunk >= threshold]
+            count += len(head)
+            total += float(head.sum())
+        else:
+            head = [val for val in chunk if val >= threshold]
+            count += len(head)
+            total += sum(head)
+    return count, total
+
+
+
+# Breaks
+
+def _headtail(read, acc, usenumpy):
+    # exact head/tail breaks with one pass over the file per break
+    if acc.n == 1:
+        return [acc.min] * 2
+    breaks = []
+    size, total = acc.n, acc.mean * acc.n
+    while True:
+        m = total / float(size)
+        headsize, headsum = _above(read(), m, usenumpy)
+        if not size - headsize > headsize:
+            break
+        breaks.append(m)
+        if headsize > 1:
+            size, total = headsize, headsum
+        else:
+            break
+    return [acc.min] + breaks + [acc.max]
+
+def file_breaks(path, algorithm, dtype="d", offset=0, nodata=None, chunksize=2**20, byteswap=False, backend=None, error=0.01, seed=None, **kwargs):
+    """
+    Calculates the break points of a raw binary file of numbers, reading the file
+    in chunks so that memory use stays constant regardless of the file size.
+
+    The histogram/equal, log, pretty, and stdev breaks are exact and need a single pass
+    over the file, and the headtail breaks are exact and need one pass for each break.
+    The quantile and natural breaks are approximate, and are calculated from a
+    `stream.QuantileSketch` of the values in a single pass, with the exact min and max.
+
+    Args:
+
+    - **path**: Path to the binary file.
+    - **algorithm**: Name of the classification algorithm to use, see `main.breaks`.
+    - **dtype**, **offset**, **nodata**, **chunksize**, **byteswap**, **backend** (optional): See `read_chunks`.
+    - **error** (optional): The approximate rank error of the quantile sketch. Defaults to 0.01, ie 1 percent.
+    - **seed** (optional): Seed for the quantile sketch, to make results reproducible.
+    - **kwargs** (optional): Any remaining kwargs are passed to the algorithm function.
+
+    Returns:
+
+    - List of break points calculated for this algorithm in increasing order.
+    """
+    usenumpy = _main._use_numpy(backend)
+    def read():
+        return _chunks(path, dtype, offset, nodata, chunksize, byteswap, usenumpy)
+
+    if algorithm in _stream.algorithms and algorithm != "quantile":
+        acc = _summarize(read(), usenumpy)
+        if acc.n == 0:
+            raise ValueError("Cannot calculate breaks for a file without any valid values")
+        return _stream.algorithms[algorithm](acc, **kwargs)
+
+    elif algorithm == "headtail":
+        acc = _summarize(read(), usenumpy)
+        if acc.n == 0:
+            raise ValueError("Cannot calculate breaks for a file without any valid values")
+        return _headtail(read, acc, usenumpy)
+
+    elif algorithm in ("quantile", "natural"):
+        sketch = _stream.QuantileSketch(error, seed)
+        for chunk in read():
+            sketch.extend(chunk.tolist() if usenumpy else chunk)
+        if sketch.n == 0:
+            raise ValueError("Cannot calculate breaks for a file without any valid values")
+        if algorithm == "quantile":
+            return _stream.quantile(sketch, **kwargs)
+        # weighted natural breaks of the retained values
+        values,weights = sketch.weighted()
+        breaks = _natural(values, weights=weights, **kwargs)
+        breaks[0] = sketch.min
+        breaks[-1] = sketch.max
+        return breaks
+
+    else:
+        raise Exception("Unknown algorithm '%s'" % algorithm)
+
+
+
+# Classifying
+
+def classify_file(path, outpath, breaks, dtype="d", offset=0, nodata=None, outtype="B", chunksize=2**20, byteswap=False, backend=None, **kwargs):
+    """
+    Classifies a raw binary file of numbers, and writes the class number of each value
+    to a new raw binary file, one chunk at a time so that memory use stays constant
+    regardless of the file size.
+
+    Args:
+
+    - **path**: Path to the binary file.
+    - **outpath**: Path of the output file, with one class number for each value in the input file.
+        The class numbers start at 1 for the first class, with 0 for nodata values and values outside the breaks.
+    - **breaks**: List of custom break values, or the name of the algorithm to use, see `file_breaks`.
+    - **dtype**, **offset**, **nodata**, **chunksize**, **byteswap**, **backend** (optional): See `read_chunks`.
+    - **outtype** (optional): The array.array typecode of the output class numbers. Defaults to 'B', ie unsigned bytes.
+    - **kwargs** (optional): Any remaining kwargs are passed to `file_breaks`.
+
+    Returns:
+
+    - The list of break points.
+    """
+    usenumpy = _main._use_numpy(backend)
+    if isinstance(breaks, str):
+        breaks = file_breaks(path, breaks, dtype=dtype, offset=offset, nodata=nodata, chunksize=chunksize,
+                             byteswap=byteswap, backend=backend, **kwargs)
+    index = breaks if isinstance(breaks, _main.BreakIndex) else _main.BreakIndex(list(breaks))
+    if len(index) >= 2 ** (8 * array(outtype).itemsize):
+        raise Exception("The output type '%s' cannot fit %s classes" % (outtype, len(index)))
+
+    with open(outpath, "wb") as outfobj:
+        for chunk in _rawchunks(path, dtype, offset, chunksize, byteswap, usenumpy):
+            if usenumpy:
+                numpy = _vectorized.numpy
+                if index.ordered:
+                    classnums = _vectorized.classify(chunk, index.breaks)
+                else:
+                    classnums = numpy.array([classnum or 0 for classnum in index.classify_many(chunk.tolist())], dtype=int)
+                invalid = numpy.isnan(chunk)
+                if nodata is not None:
+                    invalid |= chunk == nodata
+                classnums[invalid] = 0
+                outfobj.write(classnums.astype(numpy.dtype(outtype)).tobytes())
+            else:
+                classify = index.classify
+                classnums = array(outtype, [(classify(val) or 0) if val == val and val != nodata else 0
+                                            for val in chunk])
+                classnums.tofile(outfobj)
+    return index.breaks
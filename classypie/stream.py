@@ -0,0 +1,389 @@
+"""
+Streaming versions of the breakpoint algorithms, which read the values only once
+and in any order, using bounded memory. Used by main.py when streaming is enabled.
+The summaries can also be created and merged directly, e.g. to calculate
+breaks for data that is spread over several files or processes.
+"""
+
+from __future__ import division
+from . import breaks as _breaks
+import math
+import random
+
+
+
+# Summaries
+
+class Accumulator(object):
+    """
+    Single-pass summary statistics of a sequence of values, using constant memory.
+    The mean and variance are updated with Welford's algorithm, which is
+    numerically stable, and accumulators can be merged with Chan's formula.
+
+    Attributes:
+
+    - n: The number of values added.
+    - min: The minimum value added.
+    - max: The maximum value added.
+    - mean: The mean of the values added.
+    """
+
+    def __init__(self, values=None):
+        """
+        Args:
+
+        - **values** (optional): A sequence or iterator of values to add right away.
+        """
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self._m2 = 0.0
+        if values is not None:
+            self.extend(values)
+
+    def __repr__(self):
+        return "Accumulator(n=%r, min=%r, max=%r, mean=%r, stdev=%r)" % (self.n, self.min, self.max, self.mean, self.stdev)
+
+    def __len__(self):
+        return self.n
+
+    def update(self, value):
+        """
+        Adds a single value.
+        """
+        if self.n == 0:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    def extend(self, values):
+        """
+        Adds a sequence or iterator of values.
+        """
+        update = self.update
+        for value in values:
+            update(value)
+
+    def merge(self, other):
+        """
+        Merges the values of another accumulator into this one, as if
+        all of its values had been added to this accumulator.
+        """
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.n, self.min, self.max, self.mean, self._m2 = other.n, other.min, other.max, other.mean, other._m2
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self._m2 += other._m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        """
+        The population variance of the values added.
+        """
+        if self.n == 0:
+            return 0.0
+        return self._m2 / self.n
+
+    @property
+    def stdev(self):
+        """
+        The population standard deviation of the values added.
+        """
+        return math.sqrt(self.variance)
+
+# smallest capacity of a level, see QuantileSketch._capacity
+_mincapacity = 8
+
+class QuantileSketch(object):
+    """
+    A mergeable quantile sketch based on the KLL algorithm by Karnin, Lang and Liberty (2016).
+    Keeps a bounded number of values regardless of how many values are added,
+    and estimates the value at any quantile with an approximate rank error.
+
+    Values are kept in a hierarchy of compactors, where values at level h each represent
+    2^h of the original values. When a level is full it is sorted and every other value
+    is promoted to the next level.
+
+    Attributes:
+
+    - error: The approximate rank error, as a fraction of the number of values.
+    - n: The number of values added to the sketch.
+    - min: The exact minimum value added to the sketch.
+    - max: The exact maximum value added to the sketch.
+    """
+
+    def __init__(self, error=0.01, seed=None):
+        """
+        Args:
+
+        - **error** (optional): The approximate rank error, as a fraction of the number of values.
+            Memory use grows with 1/error. Defaults to 0.01, ie 1 percent.
+        - **seed** (optional): Seed for the random choices made during compaction, to make results reproducible.
+        """
+        if not 0 < error < 1:
+            raise Exception("The sketch error must be between 0 and 1")
+        self.error = error
+        self.k = max(8, int(math.ceil(2.0 / error)))
+        self.n = 0
+        self.min = None
+        self.max = None
+        self._compactors = [[]]
+        self._size = 0 # number of retained values, kept up to date by each change
+        self._capacities = None
+        self._maxsize = None
+        self._resize()
+        self._random = random.Random(seed)
+
+    def __repr__(self):
+        return "QuantileSketch(error=%r, n=%r, retained=%r)" % (self.error, self.n, self._size)
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, level):
+        # lower levels get smaller capacities, shrinking by 2/3 per level,
+        # but never so small that the lowest levels are compacted every few values
+        depth = len(self._compactors) - level - 1
+        return max(_mincapacity, int(math.ceil(self.k * (2/3.0) ** depth)))
+
+    def _resize(self):
+        # the capacities only change when a level is added, so are calculated once for each level
+        self._capacities = [self._capacity(level) for level in range(len(self._compactors))]
+        self._maxsize = sum(self._capacities)
+
+    def update(self, value):
+        """
+        Adds a single value to the sketch.
+        """
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.n += 1
+        self._compactors[0].append(value)
+        self._size += 1
+        if self._size >= self._maxsize:
+            self._compress()
+
+    def extend(self, values):
+        """
+        Adds a sequence or iterator of values to the sketch.
+        """
+        values = iter(values)
+        if self.n == 0:
+            for value in values:
+                self.update(value)
+                break
+        # same as update, with the attributes kept in local variables between compactions
+        lowest = self._compactors[0]
+        _min,_max,n,size,maxsize = self.min,self.max,self.n,self._size,self._maxsize
+        for value in values:
+            if value < _min:
+                _min = value
+            elif value > _max:
+                _max = value
+            lowest.append(value)
+            n += 1
+            size += 1
+            if size >= maxsize:
+                self.min,self.max,self.n,self._size = _min,_max,n,size
+                self._compress()
+                size,maxsize = self._size,self._maxsize
+        self.min,self.max,self.n,self._size = _min,_max,n,size
+
+    def merge(self, other):
+        """
+        Merges the values of another sketch into this sketch, as if
+        all of its values had been added to this sketch.
+        """
+        if other.n == 0:
+            return
+        while len(self._compactors) < len(other._compactors):
+            self._compactors.append([])
+        for level,compactor in enumerate(other._compactors):
+            self._compactors[level].extend(compactor)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._size = sum(len(compactor) for compactor in self._compactors)
+        self._resize()
+        while self._size >= self._maxsize:
+            self._compress()
+
+    def _compress(self):
+        # compact the lowest full level, which exists whenever the sketch is full
+        compactors = self._compactors
+        for level,capacity in enumerate(self._capacities):
+            compactor = compactors[level]
+            if len(compactor) >= capacity:
+                if level + 1 >= len(compactors):
+                    compactors.append([])
+                    self._resize()
+                # sort and promote every other value, keeping one behind if uneven
+                compactor.sort()
+                leftover = [compactor.pop()] if len(compactor) % 2 else []
+                promoted = compactor[self._random.randint(0, 1)::2]
+                compactors[level+1].extend(promoted)
+                self._size -= len(compactor) - len(promoted)
+                # emptied in place, so that extend can keep appending to the lowest level
+                compactor[:] = leftover
+                break
+
+    def weighted(self):
+        """
+        Returns the retained values in sorted order along with their weights,
+        ie how many of the original values each of them represents.
+        """
+        pairs = sorted((value, 2**level)
+                       for level,compactor in enumerate(self._compactors)
+                       for value in compactor)
+        if not pairs:
+            return [], []
+        values,weights = zip(*pairs)
+        return list(values), list(weights)
+
+    def quantile(self, q):
+        """
+        Estimates the value at quantile q, between 0 and 1.
+        """
+        if self.n == 0:
+            raise Exception("Cannot estimate quantiles of an empty sketch")
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        values,weights = self.weighted()
+        rank = q * sum(weights)
+        cumweight = 0
+        for value,weight in zip(values, weights):
+            cumweight += weight
+            if cumweight > rank:
+                return value
+        return self.max
+
+
+
+# Streaming algorithms for value breakpoints
+
+def _accumulate(values):
+    if isinstance(values, Accumulator):
+        acc = values
+    else:
+        acc = Accumulator(values)
+    if acc.n == 0:
+        raise ValueError("Cannot calculate breaks for an empty sequence of values")
+    return acc
+
+def histogram(values, **kwargs):
+    """
+    Alias for equal interval.
+    """
+    return equal(values, **kwargs)
+
+def equal(values, classes=5, interval=None, anchor=None, clip=True, start=None, end=None):
+    """
+    Equal interval algorithm, only needs the value range from a single pass.
+    Values can also be an Accumulator that has already been filled with values. 
+    """
+    acc = _accumulate(values)
+    if acc.n == 1:
+        return [acc.min] * 2
+    if start is None: start = acc.min
+    if end is None: end = acc.max
+    return _breaks.equal([start, end], classes=classes, interval=interval, anchor=anchor,
+                         clip=clip, start=start, end=end)
+
+def log(values, classes=5):
+    """
+    Log classification algorithm, only needs the value range from a single pass
+    since the log transform preserves order.
+    Values can also be an Accumulator that has already been filled with values. 
+    """
+    acc = _accumulate(values)
+    if acc.n == 1:
+        return [acc.min] * 2
+    return _breaks.log([acc.min, acc.max], classes=classes)
+
+def pretty(values, classes=5, start=None, end=None):
+    """
+    R's pretty algorithm, only needs the value range from a single pass.
+    Values can also be an Accumulator that has already been filled with values. 
+    """
+    acc = _accumulate(values)
+    if acc.n == 1:
+        return [acc.min] * 2
+    return _breaks.pretty([acc.min, acc.max], classes=classes, start=start, end=end)
+
+def stdev(values, classes=5):
+    """
+    Standard deviation class interval algorithm, with the mean and standard deviation
+    from a single pass. Values can also be an Accumulator that has already been filled with values. 
+    """
+    if isinstance(values, Accumulator):
+        acc = _accumulate(values)
+    else:
+        # keep the first few values in case there are too few to classify
+        values = iter(values)
+        first = []
+        for val in values:
+            first.append(val)
+            if len(first) > classes:
+                break
+        if not first:
+            raise ValueError("Cannot calculate breaks for an empty sequence of values")
+        if len(first) <= classes:
+            first = sorted(first)
+            return first + first[-1:]
+        acc = Accumulator(first)
+        acc.extend(values)
+
+    mean = acc.mean
+    sd2 = acc.stdev
+    res = _breaks.pretty(values=None, classes=5, start=(acc.min-mean)/sd2, end=(acc.max-mean)/sd2)
+    res2 = [(val*sd2)+mean for val in res]
+    return res2
+
+def _sketch(values, error=0.01, seed=None):
+    if isinstance(values, QuantileSketch):
+        return values
+    sketch = QuantileSketch(error, seed)
+    sketch.extend(values)
+    return sketch
+
+def quantile(values, classes=5, error=0.01, seed=None):
+    """
+    Approximate quantile algorithm, reading the values only once into a QuantileSketch
+    with the given rank error. Values can also be a QuantileSketch that has already
+    been filled with values. The first and last breaks are the exact min and max.
+    """
+    sketch = _sketch(values, error, seed)
+    if sketch.n == 0:
+        raise ValueError("Cannot calculate breaks for an empty sequence of values")
+    values,weights = sketch.weighted()
+    if sketch.n <= classes:
+        return values + [values[-1]]
+    breaks = _breaks.quantile(values, classes=classes, weights=weights)
+    breaks[0] = sketch.min
+    breaks[-1] = sketch.max
+    return breaks
+
+algorithms = dict(histogram=histogram,
+                  equal=equal,
+                  log=log,
+                  pretty=pretty,
+                  stdev=stdev,
+                  quantile=quantile)
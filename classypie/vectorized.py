@@ -0,0 +1,492 @@
+"""
+Optional NumPy backend with array versions of the value extraction, filtering,
+breakpoint algorithms and class assignment. Used automatically by main.py
+when NumPy is importable. Users should not use these directly, but rather
+use the higher-level functionality in main.py with the `backend` option.
+"""
+
+from __future__ import division
+from . import breaks as _breaks
+from . import instrument as _instrument
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+# Values
+
+def extract(items, key=None):
+    """
+    Returns a list of the items and a float array of their values, with NaN
+    for items whose values could not be converted to numbers. Array.array and
+    memoryview items are returned as is, see `take`.
+    """
+    if key is None:
+        if isinstance(items, array) and items.typecode in "bBhHiIlLqQfd":
+            # read numbers directly from the buffer, without copying float arrays
+            values = numpy.frombuffer(items, dtype=items.typecode).astype(float, copy=False)
+            return items, values
+        if isinstance(items, memoryview) and items.ndim == 1 and items.format in "bBhHiIlLqQfd":
+            values = numpy.asarray(items).astype(float, copy=False)
+            return items, values
+        if not isinstance(items, (list, tuple, numpy.ndarray)):
+            items = list(items)
+        try:
+            values = numpy.asarray(items, dtype=float)
+            if values.ndim == 1:
+                return items, values
+        except (TypeError, ValueError):
+            pass
+        getval = lambda item: item
+    else:
+        if not isinstance(items, (list, tuple)):
+            items = list(items)
+        getval = key
+
+    def forcenumber(item):
+        # errors in the key itself are raised
+        val = getval(item)
+        try:
+            return float(val)
+        except (TypeError, ValueError, OverflowError):
+            return float("nan")
+
+    values = numpy.fromiter((forcenumber(item) for item in items), dtype=float, count=len(items))
+    return items, values
+
+def _numeric(vals):
+    if not isinstance(vals, (list,tuple,set)): vals = [vals]
+    numeric = []
+    for val in vals:
+        try: numeric.append(float(val))
+        except: pass
+    return numeric
+
+def filtermask(values, exclude=None, minval=None, maxval=None, only=None):
+    """
+    Returns a boolean mask of the values that are valid numbers and pass the filters.
+    """
+    mask = ~numpy.isnan(values)
+    if only is not None:
+        mask &= numpy.isin(values, _numeric(only))
+    if exclude is not None:
+        mask &= ~numpy.isin(values, _numeric(exclude))
+    if minval is not None: mask &= values >= minval
+    if maxval is not None: mask &= values <= maxval
+    return mask
+
+def take(items, indexes):
+    """
+    Returns a list of the items at the given array of indexes, or an array.array
+    with the same typecode if the items are an array.array or memoryview of numbers.
+    """
+    if isinstance(items, numpy.ndarray):
+        return items[indexes].tolist()
+    if isinstance(items, (array, memoryview)):
+        if isinstance(items, array):
+            typecode = items.typecode
+            data = numpy.frombuffer(items, dtype=typecode)[indexes].tobytes()
+        else:
+            typecode = items.format
+            data = numpy.asarray(items)[indexes].tobytes()
+        taken = array(typecode)
+        if hasattr(taken, "frombytes"):
+            taken.frombytes(data)
+        else:
+            taken.fromstring(data)
+        return taken
+    return [items[i] for i in indexes.tolist()]
+
+def extract_weights(items, weights):
+    """
+    Returns a float array of weights, either from a sequence of weights
+    or a function that returns the weight of each item. 
+    """
+    if callable(weights):
+        def forcenumber(item):
+            weight = weights(item)
+            try:
+                return float(weight)
+            except (TypeError, ValueError, OverflowError):
+                return float("nan")
+        return numpy.fromiter((forcenumber(item) for item in items), dtype=float, count=len(items))
+    else:
+        weights = numpy.asarray(weights, dtype=float)
+        if len(weights) != len(items):
+            raise Exception("The number of weights must be the same as the number of items")
+        return weights
+
+def issorted(values):
+    """
+    Checks whether an array of values is in increasing order.
+    """
+    return bool(numpy.all(values[1:] >= values[:-1]))
+
+def prepare(items, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False):
+    """
+    Extracts, filters and sorts the items by their values.
+    Returns the sorted items and their sorted float array of values and weights,
+    where weights is None if not given. 
+    """
+    items, order, values, weights = argprepare(items, key, exclude, minval, maxval, weights, presorted)
+    prof = _instrument.current()
+    if prof: start = prof.start()
+    items = take(items, order)
+    if prof: prof.stop("sort", start)
+    return items, values, weights
+
+def argprepare(items, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False):
+    """
+    Same as prepare, but instead of sorting the items returns the list or array of all
+    the items, and an integer array of the indexes of the kept items in sorted order. 
+    """
+    prof = _instrument.current()
+    if prof: start = prof.start()
+    items, values = extract(items, key)
+    mask = filtermask(values, exclude, minval, maxval)
+    if weights is not None:
+        weights = extract_weights(items, weights)
+        mask &= weights > 0
+    indexes = numpy.flatnonzero(mask)
+    if prof:
+        prof.stop("extract", start)
+        prof.count("items_seen", len(values))
+        prof.count("items_kept", len(indexes))
+        start = prof.start()
+    if presorted and issorted(values[indexes]):
+        order = indexes
+    else:
+        order = indexes[numpy.argsort(values[indexes], kind="stable")]
+    if weights is not None:
+        weights = weights[order]
+    values = values[order]
+    if prof: prof.stop("sort", start)
+    return items, order, values, weights
+
+def prepare_values(items, key=None, exclude=None, minval=None, maxval=None, weights=None, presorted=False, sort=True):
+    """
+    Same as prepare, but only returns the sorted float arrays of values and weights. 
+    If sort is False, the values are kept in their original order, for algorithms that
+    only need the value range or mean and standard deviation. 
+    """
+    prof = _instrument.current()
+    if prof: start = prof.start()
+    items, values = extract(items, key)
+    mask = filtermask(values, exclude, minval, maxval)
+    if weights is not None:
+        weights = extract_weights(items, weights)
+        mask &= weights > 0
+        weights = weights[mask]
+    seen = len(values)
+    values = values[mask]
+    if prof:
+        prof.stop("extract", start)
+        prof.count("items_seen", seen)
+        prof.count("items_kept", len(values))
+    if not sort:
+        return values, weights
+    if prof: start = prof.start()
+    if not (presorted and issorted(values)):
+        if weights is not None:
+            order = numpy.argsort(values, kind="stable")
+            values, weights = values[order], weights[order]
+        else:
+            values.sort()
+    if prof: prof.stop("sort", start)
+    return values, weights
+
+def classify(values, breaks):
+    """
+    Returns an integer array of the class number of each value (1 as the first class),
+    with 0 for values outside the breakpoints. Follows the same rules as `main.BreakIndex`.
+    """
+    brks = numpy.asarray(breaks, dtype=float)
+    values = numpy.asarray(values, dtype=float)
+    left = numpy.searchsorted(brks, values, "left")
+    right = numpy.searchsorted(brks, values, "right")
+    classnums = right.copy()
+    # inclusive upper end of last class
+    end = right == len(brks)
+    classnums[end] = numpy.where(values[end] == brks[-1], len(brks)-1, 0)
+    # values exactly on repeated breaks belong to the first collapsed class
+    collapsed = right - left >= 2
+    classnums[collapsed] = left[collapsed] + 1
+    return classnums
+
+def groups(classnums):
+    """
+    Given an array of class numbers where same classes are adjacent,
+    iterates over each class number along with its start and end index.
+    """
+    if not len(classnums):
+        return
+    starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(classnums)) + 1))
+    ends = numpy.concatenate((starts[1:], [len(classnums)]))
+    for start,end in zip(starts.tolist(), ends.tolist()):
+        yield int(classnums[start]), start, end
+
+
+
+# Algorithms for value breakpoints, expects a sorted float array
+# except for equal, log, pretty and stdev which only need the value range or moments
+
+def _sum(values):
+    # sequential summation in the same order as the builtin sum()
+    # so that results are identical to the pure python algorithms
+    if not len(values):
+        return 0.0
+    return float(numpy.cumsum(values)[-1])
+
+def _range(values):
+    # min and max of sorted or unsorted values
+    if not len(values):
+        raise ValueError("Cannot calculate breaks for an empty sequence of values")
+    return float(values.min()), float(values.max())
+
+def histogram(values, **kwargs):
+    """
+    Alias for equal interval.
+    """
+    return equal(values, **kwargs)
+
+def equal(values, classes=5, interval=None, anchor=None, clip=True, start=None, end=None, weights=None):
+    """
+    Equal interval algorithm, only depends on the value range.
+    """
+    if len(values) == 1:
+        return values.tolist() * 2
+    _min,_max = _range(values)
+    if start is None: start = _min
+    if end is None: end = _max
+    return _breaks.equal([start, end], classes=classes, interval=interval, anchor=anchor,
+                         clip=clip, start=start, end=end)
+
+def log(values, classes=5, weights=None):
+    """
+    Log classification algorithm, only depends on the value range
+    since the log transform preserves order.
+    """
+    if len(values) == 1:
+        return values.tolist() * 2
+    return _breaks.log(list(_range(values)), classes=classes)
+
+def quantile(values, classes=5, weights=None):
+    """
+    Quantile algorithm, interpolating all the quantile positions at once.
+    """
+    if len(values) <= classes:
+        return values.tolist() + [float(values[-1])]
+
+    n = len(values)
+    q = numpy.arange(classes) / float(classes)
+    if weights is not None:
+        # interpolate on the normalized cumulative weights instead of the value indexes
+        # each value stays flat while its weight exceeds one unit, see breaks._weighted_knots
+        cumweights = numpy.cumsum(weights)
+        total = float(cumweights[-1])
+        starts = numpy.concatenate(([0.0], cumweights[:-1])) / total
+        ends = cumweights / total - 1 / total
+        positions = numpy.column_stack((starts, ends)).ravel()
+        posvalues = numpy.repeat(values, 2)
+        keep = numpy.ones(len(positions), dtype=bool)
+        keep[1::2] = ends > starts
+        Xq = numpy.interp(q, positions[keep], posvalues[keep])
+        return Xq.tolist() + [float(values[n-1])]
+    a = q * n
+    aa = a.astype(int)
+    r = a - aa
+    Xq = (1 - r) * values[aa] + r * values[aa+1]
+    return Xq.tolist() + [float(values[n-1])]
+
+def pretty(values, classes=5, start=None, end=None, weights=None):
+    """
+    R's pretty algorithm, only depends on the value range.
+    """
+    if len(values) == 1:
+        return values.tolist() * 2
+    return _breaks.pretty(list(_range(values)), classes=classes, start=start, end=end)
+
+def stdev(values, classes=5, weights=None):
+    """
+    Standard deviation class interval algorithm, with the mean and
+    standard deviation calculated as array operations. Values do not need to be sorted.
+    """
+    _min,_max = _range(values)
+    if len(values) <= classes:
+        return numpy.sort(values).tolist() + [_max]
+
+    if weights is not None:
+        N = _sum(weights)
+        mean = _sum(values * weights) / N
+        sd = values - mean
+        sd2 = math.sqrt(_sum(weights * sd * sd) / N)
+    else:
+        N = len(values)
+        mean = _sum(values) / N
+        sd = values - mean
+        sd2 = math.sqrt(_sum(sd * sd) / N)
+    res = _breaks.pretty(values=None, classes=5, start=(_min-mean)/sd2, end=(_max-mean)/sd2)
+    res2 = [(val*sd2)+mean for val in res]
+    return res2
+
+def headtail(values, classes=5, weights=None):
+    """
+    Head tails classification scheme. Since the values are sorted the head is always
+    the remaining top of the array, found with a binary search.
+    """
+    if len(values) == 1:
+        return values.tolist() * 2
+
+    n = len(values)
+    breaks = []
+    lo = 0
+    while True:
+        if weights is not None:
+            m = _sum(values[lo:] * weights[lo:]) / _sum(weights[lo:])
+        else:
+            m = _sum(values[lo:]) / (n - lo)
+        split = lo + int(numpy.searchsorted(values[lo:], m, "left"))
+        if weights is not None:
+            headsize = _sum(weights[split:])
+            tailsize = _sum(weights[lo:split])
+        else:
+            headsize = n - split
+            tailsize = split - lo
+        if not tailsize > headsize:
+            break
+        breaks.append(m)
+        if n - split > 1:
+            lo = split
+        else:
+            break
+
+    breaks.insert(0, float(values[0]))
+    breaks.append(float(values[-1]))
+    return breaks
+
+def _jenks(values, classes, weights=None):
+    # exact optimal breaks, same as the pure python version but with all
+    # midpoints at each level of the divide-and-conquer processed at once
+    starts = _jenks_table(values, classes, weights)
+    return _jenks_backtrack(values, starts, classes)
+
+def _jenks_many(values, classes, weights=None):
+    # exact optimal breaks for several numbers of classes from a single table
+    starts = _jenks_table(values, max(classes), weights)
+    return dict((k, _jenks_backtrack(values, starts, k)) for k in classes)
+
+def _jenks_table(values, classes, weights=None):
+    # the optimal start of the last class for each end value and number of classes
+    n = len(values)
+    shifted = values - values[n // 2]
+    if weights is None:
+        counts = numpy.arange(n+1, dtype=float)
+        sums = numpy.concatenate(([0.0], numpy.cumsum(shifted)))
+        sqsums = numpy.concatenate(([0.0], numpy.cumsum(shifted * shifted)))
+    else:
+        counts = numpy.concatenate(([0.0], numpy.cumsum(weights)))
+        sums = numpy.concatenate(([0.0], numpy.cumsum(weights * shifted)))
+        sqsums = numpy.concatenate(([0.0], numpy.cumsum(weights * shifted * shifted)))
+
+    def ssq(j, m):
+        s1 = sums[m+1] - sums[j]
+        return sqsums[m+1] - sqsums[j] - s1 * s1 / (counts[m+1] - counts[j])
+
+    allm = numpy.arange(n)
+    cost = ssq(numpy.zeros(n, dtype=int), allm)
+
+    starts = [None, None]
+    cells = 0
+    for k in range(2, classes+1):
+        prevcost = cost
+        cost = numpy.full(n, numpy.inf)
+        start = numpy.zeros(n, dtype=int)
+        lo = numpy.array([k-1])
+        hi = numpy.array([n-1])
+        optlo = numpy.array([k-1])
+        opthi = numpy.array([n-1])
+        while len(lo):
+            m = (lo + hi) // 2
+            sizes = numpy.minimum(opthi, m) - optlo + 1
+            cells += int(sizes.sum())
+            offsets = numpy.cumsum(sizes) - sizes
+            seg = numpy.repeat(numpy.arange(len(m)), sizes)
+            j = optlo[seg] + numpy.arange(len(seg)) - offsets[seg]
+            c = prevcost[j-1] + ssq(j, m[seg])
+            # first minimum of each midpoint's candidates
+            best = numpy.minimum.reduceat(c, offsets)
+            hits = numpy.flatnonzero(c == best[seg])
+            first = hits[numpy.concatenate(([True], numpy.diff(seg[hits]) != 0))]
+            bestj = j[first]
+            cost[m] = best
+            start[m] = bestj
+            # split into the lower and upper halves
+            left = lo < m
+            right = m < hi
+            lo, hi, optlo, opthi = (numpy.concatenate((lo[left], m[right] + 1)),
+                                    numpy.concatenate((m[left] - 1, hi[right])),
+                                    numpy.concatenate((optlo[left], bestj[right])),
+                                    numpy.concatenate((bestj[left], opthi[right])))
+        starts.append(start)
+    prof = _instrument.current()
+    if prof: prof.count("dp_cells", cells)
+    return starts
+
+def _jenks_backtrack(values, starts, classes):
+    # backtrack the class starts, each break is the last value of the previous class
+    n = len(values)
+    kclass = [0] * (classes+1)
+    kclass[0] = float(values[0])
+    kclass[classes] = float(values[n-1])
+    m = n - 1
+    for k in range(classes, 1, -1):
+        j = int(starts[k][m])
+        kclass[k-1] = float(values[j-1])
+        m = j - 1
+    return kclass
+
+def natural(values, classes=5, maxsize=None, samples=3, weights=None, workers=None, seed=None):
+    """
+    Jenks natural breaks, calculated exactly with array operations.
+    Optional subsampling uses the pure Python implementation. 
+    """
+    if len(values) <= classes:
+        return values.tolist() + [float(values[-1])]
+    if maxsize and len(values) > maxsize:
+        if weights is not None:
+            weights = weights.tolist()
+        return _breaks.natural(values.tolist(), classes=classes, maxsize=maxsize, samples=samples,
+                               weights=weights, workers=workers, seed=seed)
+    return _jenks(values, classes, weights)
+
+algorithms = dict(histogram=histogram,
+                  equal=equal,
+                  log=log,
+                  quantile=quantile,
+                  pretty=pretty,
+                  stdev=stdev,
+                  headtail=headtail,
+                  natural=natural)
+
+
+
+# Rescaling
+
+def rescale(values, oldmin, oldmax, newmin, newmax):
+    """
+    Linearly rescales an array of values from the old to the new range.
+    Sequences of newmin/newmax are rescaled per sequence number, returning
+    one array for each. 
+    """
+    oldrange = oldmax - oldmin
+    relvals = (values - oldmin) / float(oldrange)
+    if hasattr(newmin, "__iter__") and hasattr(newmax, "__iter__"):
+        return [ifromval + (itoval - ifromval) * relvals
+                for ifromval,itoval in zip(newmin,newmax)]
+    else:
+        return newmin + (newmax - newmin) * relvals
@@ -18,7 +18,6 @@ for valrang,members in c.membership(vals, [(-10000,100000),(-10000,0),(0,1000000
   print(valrang,len(members))
 
 
-fdsf
 
 
 ##import pyagg
@@ -0,0 +1,207 @@
+"""
+Benchmarks the speed and memory use of the breaks algorithms and main entry points
+for different data sizes and value distributions.
+
+Run from the repository root:
+
+    python testing/benchmark.py
+    python testing/benchmark.py --sizes 1000 100000 --output new.json --compare old.json
+
+Results are printed as a table, and optionally written as JSON so that they
+can be compared between versions with --compare. Options that an older version
+does not support, such as backend and presorted, are left out when benchmarking it,
+e.g. by copying this script into a checkout of that version. Peak memory is measured
+with tracemalloc in a separate run, and is only available on Python 3.4+.
+"""
+
+from __future__ import print_function, division
+import os
+import sys
+import json
+import inspect
+import random
+import argparse
+import platform
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import classypie as cp
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+
+# Data
+
+def uniform(n, rand):
+    return [rand.uniform(1, 1000) for _ in range(n)]
+
+def skewed(n, rand):
+    # power law
+    return [rand.paretovariate(1.5) for _ in range(n)]
+
+def duplicated(n, rand):
+    return [float(rand.randint(1, 20)) for _ in range(n)]
+
+def presorted(n, rand):
+    return sorted(uniform(n, rand))
+
+distributions = dict(uniform=uniform,
+                     skewed=skewed,
+                     duplicated=duplicated,
+                     presorted=presorted)
+
+
+
+# Cases
+
+algorithms = ("histogram", "equal", "quantile", "pretty", "stdev", "natural", "headtail", "log")
+
+def parameters(func):
+    # names of the arguments of a function in the installed version
+    try:
+        return set(inspect.signature(func).parameters)
+    except AttributeError:
+        # python 2
+        return set(inspect.getargspec(func).args)
+
+def supported(func, kwargs):
+    # only the kwargs that are arguments of func, so that older versions can be benchmarked
+    names = parameters(func)
+    return dict((name,val) for name,val in kwargs.items() if name in names)
+
+def cases(values, distribution, args):
+    # yields each case name along with a function that runs it
+    n = len(values)
+    sortkw = dict(presorted=True) if distribution == "presorted" else dict()
+    backendkw = dict(backend=args.backend)
+    # options of breaks are also options of Classifier, which passes any others to the algorithm
+    options = supported(cp.breaks, dict(sortkw, **backendkw))
+    lo,hi = min(values), max(values)
+    mid = (lo + hi) / 2.0
+
+    for algo in algorithms:
+        kwargs = dict(options)
+        if algo == "natural" and n > args.natural_maxsize:
+            kwargs.update(supported(cp.main._breaks.natural, dict(maxsize=args.natural_maxsize, seed=1)))
+        yield "breaks-%s" % algo, lambda algo=algo, kwargs=kwargs: cp.breaks(values, algo, **kwargs)
+
+    def split():
+        for _ in cp.split(values, "quantile", **supported(cp.split, dict(sortkw, **backendkw))):
+            pass
+    yield "split", split
+
+    def unique():
+        for _ in cp.unique(values):
+            pass
+    yield "unique", unique
+
+    def membership():
+        for _ in cp.membership(values, [(lo,mid), (mid,hi), (lo,hi)]):
+            pass
+    yield "membership", membership
+
+    def rescale():
+        for _ in cp.rescale(values, 0, 100, **supported(cp.rescale, backendkw)):
+            pass
+    yield "rescale", rescale
+
+    def classifier():
+        for _ in cp.Classifier(values, "quantile", [(0,0,0),(255,0,0)], **options):
+            pass
+    yield "classifier", classifier
+
+
+
+# Measuring
+
+def measure(func, repeat, memory):
+    timer = timeit.default_timer
+    best = None
+    for _ in range(repeat):
+        t = timer()
+        func()
+        elapsed = timer() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    peak = None
+    if memory and tracemalloc:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+def run(args):
+    results = []
+    for n in args.sizes:
+        for distribution in args.distributions:
+            values = distributions[distribution](n, random.Random(args.seed))
+            for case,func in cases(values, distribution, args):
+                if args.cases and case not in args.cases:
+                    continue
+                seconds,peak = measure(func, args.repeat, args.memory)
+                result = dict(case=case, distribution=distribution, n=n, seconds=seconds, peak_bytes=peak)
+                results.append(result)
+                report(result, args.baseline)
+    return results
+
+def report(result, baseline):
+    line = "%-18s %-11s %9d %10.4fs" % (result["case"], result["distribution"], result["n"], result["seconds"])
+    if result["peak_bytes"] is not None:
+        line += " %9.1fMB" % (result["peak_bytes"] / 1024.0**2)
+    old = baseline.get((result["case"], result["distribution"], result["n"]))
+    if old:
+        line += "  x%.2f" % (old["seconds"] / result["seconds"] if result["seconds"] else float("inf"))
+    print(line)
+    sys.stdout.flush()
+
+def load_baseline(path):
+    # results of a previous run, by case, distribution and size
+    if not path:
+        return dict()
+    with open(path) as fobj:
+        data = json.load(fobj)
+    return dict(((res["case"], res["distribution"], res["n"]), res) for res in data["results"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ClassyPie")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10**3, 10**4, 10**5, 10**6, 10**7])
+    parser.add_argument("--distributions", nargs="+", choices=sorted(distributions),
+                        default=["uniform", "skewed", "duplicated", "presorted"])
+    parser.add_argument("--cases", nargs="+", help="Only run these cases, e.g. breaks-natural split")
+    parser.add_argument("--backend", default="auto", choices=["auto", "numpy", "python"])
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs, the fastest is reported")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip measuring peak memory")
+    parser.add_argument("--natural-maxsize", type=int, default=10**5,
+                        help="Larger inputs use subsampled natural breaks of this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Show speedups relative to the results in this JSON file")
+    args = parser.parse_args()
+    args.baseline = load_baseline(args.compare)
+
+    # repeated runs would otherwise time cached breaks
+    if hasattr(cp, "cache"):
+        cp.cache.set_memory_cache(None)
+        cp.cache.set_disk_cache(None)
+
+    print("%-18s %-11s %9s %11s %11s" % ("case", "data", "n", "time", "peak"))
+    results = run(args)
+
+    if args.output:
+        meta = dict(classypie=cp.__version__,
+                    python=platform.python_version(),
+                    platform=platform.platform(),
+                    backend=args.backend,
+                    numpy=getattr(getattr(cp.main, "_vectorized", None), "numpy", None) is not None)
+        with open(args.output, "w") as fobj:
+            json.dump(dict(meta=meta, results=results), fobj, indent=1)
+
+if __name__ == "__main__":
+    main()
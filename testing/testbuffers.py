@@ -0,0 +1,40 @@
+"""
+Checks that the split members of array.array and memoryview inputs are arrays with
+the same typecode as the input, with the same members on both backends.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import random
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import classypie as cp
+
+rand = random.Random(1)
+numbers = [rand.randint(0, 100) for _ in range(300)]
+
+backends = ["python"]
+if cp.main._vectorized.numpy is not None:
+    backends.append("numpy")
+
+inputs = [array(typecode, numbers) for typecode in "bBhHiIlLqQfd"]
+inputs.append(memoryview(array("i", numbers)))
+inputs.append(memoryview(array("d", numbers)))
+
+for items in inputs:
+    typecode = items.typecode if isinstance(items, array) else items.format
+    expected = None
+    for backend in backends:
+        groups = list(cp.split(items, "quantile", exclude=[50], minval=5, backend=backend))
+        for valrange,members in groups:
+            assert isinstance(members, array), (typecode, backend, type(members))
+            assert members.typecode == typecode, (typecode, backend, members.typecode)
+        result = [(valrange, list(members)) for valrange,members in groups]
+        assert sum(len(members) for _,members in result) == len([n for n in numbers if n != 50 and n >= 5])
+        if expected is None:
+            expected = result
+        assert result == expected, (typecode, backend)
+
+print("ok")
@@ -0,0 +1,45 @@
+"""
+Checks that NaN values are left out the same way by the pure Python and NumPy backends,
+whether the values are given as a list, an array.array, or extracted with a key.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import random
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import classypie as cp
+
+nan = float("nan")
+rand = random.Random(1)
+clean = [rand.uniform(0, 100) for _ in range(200)]
+values = list(clean)
+for i in range(0, len(values), 7):
+    values.insert(i, nan)
+
+def close(breaks, other):
+    return (len(breaks) == len(other)
+            and all(abs(a - b) <= 1e-9 * max(1, abs(b)) for a,b in zip(breaks, other)))
+
+backends = ["python"]
+if cp.main._vectorized.numpy is not None:
+    backends.append("numpy")
+
+inputs = dict(list=(values, None),
+              array=(array("d", values), None),
+              key=([dict(val=val) for val in values], "val"))
+
+for algo in ("equal", "quantile", "natural", "pretty", "stdev", "headtail"):
+    expected = cp.breaks(clean, algo, backend="python")
+    for backend in backends:
+        for name,(items,key) in inputs.items():
+            result = cp.breaks(items, algo, key=key, backend=backend)
+            assert close(result, expected), (algo, backend, name, result, expected)
+
+for backend in backends:
+    members = [len(group) for _,group in cp.split(values, "quantile", backend=backend)]
+    assert sum(members) == len(clean), (backend, members)
+    assert close(cp.breaks(iter(values), "equal", stream=True), cp.breaks(clean, "equal"))
+    print(backend, "ok")
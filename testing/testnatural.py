@@ -0,0 +1,34 @@
+"""
+Checks natural breaks when there are more classes than distinct values: the breaks
+must still be in increasing order, span the values, and be the same on both backends.
+"""
+
+from __future__ import print_function
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import classypie as cp
+
+datasets = [[1,1,1,2,2,3,3,3],
+            [5,5,5,5,1,1,9,9,9,9,9],
+            [0,0,0,0,10,10,10,10,10,10]]
+
+backends = ["python"]
+if cp.main._vectorized.numpy is not None:
+    backends.append("numpy")
+
+for values in datasets:
+    for classes in (4, 5, 6):
+        results = []
+        for backend in backends:
+            breaks = cp.breaks(values, "natural", classes=classes, backend=backend)
+            assert len(breaks) == classes + 1, (values, classes, breaks)
+            assert breaks == sorted(breaks), (values, classes, backend, breaks)
+            assert breaks[0] == min(values) and breaks[-1] == max(values), (values, classes, breaks)
+            grouped = sum(len(members) for _,members in cp.split(values, breaks, backend=backend))
+            assert grouped == len(values), (values, classes, backend, breaks)
+            results.append(breaks)
+        assert all(breaks == results[0] for breaks in results), (values, classes, results)
+
+print("ok")
@@ -0,0 +1,41 @@
+"""
+Checks that weighted breaks are the same as the breaks of the same data with each
+value repeated as many times as its weight, and that fractional weights do not
+change the number of breaks.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import classypie as cp
+
+rand = random.Random(1)
+values = sorted(set(rand.randint(0, 1000) for _ in range(60)))
+weights = [rand.randint(1, 6) for _ in values]
+expanded = [val for val,w in zip(values, weights) for _ in range(w)]
+
+def close(breaks, other):
+    return (len(breaks) == len(other)
+            and all(abs(a - b) <= 1e-9 * max(1, abs(b)) for a,b in zip(breaks, other)))
+
+backends = ["python"]
+if cp.main._vectorized.numpy is not None:
+    backends.append("numpy")
+
+for backend in backends:
+    for algo in ("quantile", "stdev", "headtail", "natural", "equal", "pretty"):
+        for classes in (3, 5, 7):
+            weighted = cp.breaks(values, algo, weights=weights, classes=classes, backend=backend)
+            unweighted = cp.breaks(expanded, algo, classes=classes, backend=backend)
+            assert close(weighted, unweighted), (backend, algo, classes, weighted, unweighted)
+
+    # fractional weights
+    for algo in ("quantile", "stdev"):
+        fractional = cp.breaks(list(range(20)), algo, weights=[0.1] * 20, backend=backend)
+        unit = cp.breaks(list(range(20)), algo, backend=backend)
+        assert close(fractional, unit), (backend, algo, fractional, unit)
+
+    print(backend, "ok")